@@ -1,7 +1,9 @@
 import dash
 
 # meta_tags are required for the app layout to be mobile responsive
-app = dash.Dash(__name__, suppress_callback_exceptions=True,
+# compress: the responses are compressed (gzip or brotli) when the browser accepts it, which makes the
+# JSON of the callbacks and the scripts of the app several times smaller on slow mobile connections
+app = dash.Dash(__name__, suppress_callback_exceptions=True, compress=True,
                 meta_tags=[{'name': 'viewport',
                             'content': 'width=device-width, initial-scale=1.0'}]
                 )
@@ -0,0 +1,44 @@
+// --------------------------- Calculating the Overall Risk in the Browser --------------------------------
+
+// The overall risk only adds up normalised values, so it is calculated here
+// instead of sending a request to the server (see pages/overall.py)
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    overall: {
+        update_graph: function(scores, trans, risk, city, template) {
+            var text = ['very low', 'low', 'high', 'very high']; // Assign text levels for each indicator value
+
+            // The values of the city are sent by the server once the city is known
+            if (!scores) {
+                return [template, '', city];
+            }
+
+            // The transmission risk of the place and the personal risk chosen by the user on the other pages are used
+            // when there are any, otherwise the ones of the city and of the answers given in the form
+            if (trans === null || trans === undefined) {
+                trans = scores.transmission;
+            }
+            if (risk === null || risk === undefined) {
+                risk = scores.risk;
+            }
+            // The city is missing from some of the sheets
+            if (scores.health === null || scores.prevalence === null || trans === null || risk === null) {
+                return [template, 'There is no data for this city', city];
+            }
+
+            var overall = Math.trunc(scores.health + scores.prevalence + trans + risk); // Calculate the value of overall risk
+            var level = Math.min(overall, 3); // The highest level also covers the upper limit
+
+            // Only the value of the pointer changes, the rest of the linear gauge is shared with the template
+            // Add 0.5 to the value the pointer must be set to
+            // This is so that the pointer is at the centre and not the edge of each coloured rectange in the linear gauge
+            var figure = {
+                data: [Object.assign({}, template.data[0], {value: level + 0.5})],
+                layout: template.layout
+            };
+
+            // Output the linear gauge, the text level and the placeholder text that's displayed alongside the linear gauge
+            return [figure, text[level], city];
+        }
+    }
+});
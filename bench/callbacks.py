@@ -0,0 +1,170 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from bench import sheets
+
+# --------------------------- Timing the Callbacks --------------------------------
+
+# python -m bench.callbacks --sizes small medium large --output bench-results.json
+#
+# Times the import of the app, loading the data, the router and the update_graph callback of every page
+# against the generated worksheets (see bench/sheets.py), for each size of data, and refreshing Prevalence_Live
+# Each size is timed in a new process so that the import and the first load are really the first ones
+# The Overall Risk is calculated in the browser (see assets/overall.js), only the scores it adds up come from the server
+#
+# The results are written as JSON, with the times in milliseconds, so that two versions can be compared
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output = True, text = True,
+                              check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _stats(times):
+    times = np.array(times) * 1000
+    return {'calls': len(times), 'min': times.min(), 'median': np.median(times),
+            'p95': np.percentile(times, 95), 'mean': times.mean()}
+
+
+def _time(function, arguments, repeat):
+    # Call the function repeat times, going round the list of arguments
+    times = []
+    for i in range(repeat):
+        args = arguments[i % len(arguments)]
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+    return _stats(times)
+
+
+def _once(function):
+    start = time.perf_counter()
+    value = function()
+    return (time.perf_counter() - start) * 1000, value
+
+
+def run(size, repeat, seed = 0):
+    # The times for one size of data, must be called in a process that hasn't imported the app yet
+    spreadsheet = sheets.install(size, seed = seed)
+    rng = np.random.default_rng(seed)
+    cities = sheets.SIZES[size]['cities']
+
+    import_ms, index = _once(lambda: __import__('index'))
+    import data
+    import dropdowns
+    from pages import riskProfile, healthSystem, prevalence, transmission, overall, trends
+
+    load_ms, snapshot = _once(data.current)
+    restore_ms, restored = _once(data.restore)
+    publish_ms, _ = _once(lambda: data.publish(restored)) # The derived tables are computed again for the restored snapshot
+
+    profiles = [tuple(int(code) for code in profile) for profile in zip(
+        rng.integers(1, 3, 64), rng.integers(1, 4, 64), rng.integers(1, cities + 1, 64), rng.integers(0, 2, 64),
+        rng.integers(0, 2, 64), rng.integers(1, 3, 64), rng.integers(1, 4, 64), rng.integers(0, 2, 64),
+        rng.integers(0, 2, 64))]
+    # Households of 1 to 20 members, the first one has the age and comorbidities of the household member of each profile
+    households = [[list(profile[6:])] + [[int(rng.integers(1, 4)), int(rng.integers(0, 2)), int(rng.integers(0, 2))]
+                                         for member in range(size)]
+                  for profile, size in zip(profiles, rng.integers(0, 20, 64))]
+    city_list = [(int(city),) for city in rng.integers(1, cities + 1, 64)]
+    respondents = list(snapshot['responses'][data.RESPONDENT_COLUMN].iloc[:64]) + [None]
+    routes = [(route, None, respondent) for route in index.PAGES for respondent in respondents]
+    searches = [(text, city) for text in ('d', 'c', 'city 1', '1', 'x') for (city,) in city_list[:8]]
+
+    callbacks = {
+        'index.display_page': (index.display_page, routes),
+        'dropdowns.city_options': (dropdowns.city_options, searches),
+        'riskProfile.update_graph': (riskProfile.update_graph, [profile[:5] + tuple(zip(*members)) + (False,)
+                                                                for profile, members in zip(profiles, households)]),
+        'riskProfile.risk_interval': (riskProfile.risk_interval, [(gender, city, age, diabetes, hyper, members)
+                                                                  for (gender, age, city, diabetes, hyper, *_), members
+                                                                  in zip(profiles, households)]),
+        'healthSystem.update_graph': (healthSystem.update_graph, city_list),
+        'prevalence.update_graph': (prevalence.update_graph, city_list),
+        'transmission.update_graph': (transmission.update_graph, city_list),
+        'overall.city_scores': (overall.city_scores, [(city, list(profile[:2] + profile[3:5]))
+                                                      for (city,), profile in zip(city_list, profiles)]),
+        'trends.trend': (trends.trend, [(city, None) for (city,) in city_list] + [(city, (100, 200)) for (city,) in city_list])
+    }
+    timings = {}
+    for name, (callback, arguments) in callbacks.items():
+        # Callbacks whose results are cached are timed both without the cache and with it
+        if hasattr(callback, '__wrapped__'):
+            timings[name] = _time(callback.__wrapped__, arguments, repeat)
+            _time(callback, arguments, len(arguments)) # Fill the cache first
+            timings[name + ' (cached)'] = _time(callback, arguments, repeat)
+        else:
+            timings[name] = _time(callback, arguments, repeat)
+
+    # Refreshing Prevalence_Live: the first refresh of the restored snapshot reads the whole worksheet,
+    # the one after a day has been added only reads the latest rows (see data.LiveHistory)
+    refresh = {}
+    for name in ('whole', 'new day'):
+        if name == 'new day':
+            sheets.next_day(spreadsheet.sheets, seed)
+        cells = spreadsheet.cells
+        refresh[name], _ = _once(lambda: data.refresh(('live',)))
+        refresh[name + ' cells'] = spreadsheet.cells - cells
+
+    shutil.rmtree(data.SNAPSHOT_DIR, ignore_errors = True)
+    return {
+        'data': dict(sheets.SIZES[size], seed = seed),
+        'rows': {name: len(frame) for name, frame in snapshot.frames.items()},
+        'sheets_api_requests': spreadsheet.requests,
+        'startup': {'import': import_ms, 'load': load_ms, 'restore': restore_ms, 'publish': publish_ms},
+        'refresh_live': refresh,
+        'callbacks': timings
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Time the callbacks against generated worksheets')
+    parser.add_argument('--sizes', nargs = '+', default = list(sheets.SIZES), choices = list(sheets.SIZES))
+    parser.add_argument('--repeat', type = int, default = 200, help = 'number of calls timed for each callback')
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--output', help = 'file to write the results to, they are printed otherwise')
+    parser.add_argument('--child', help = argparse.SUPPRESS) # Used to time one size in a new process
+    args = parser.parse_args()
+
+    if args.child:
+        json.dump(run(args.child, args.repeat, args.seed), sys.stdout)
+        return
+
+    results = {
+        'commit': _git_commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'repeat': args.repeat,
+        'sizes': {}
+    }
+    for size in args.sizes:
+        child = subprocess.run([sys.executable, '-m', 'bench.callbacks', '--child', size,
+                                '--repeat', str(args.repeat), '--seed', str(args.seed)],
+                               capture_output = True, text = True, check = True)
+        results['sizes'][size] = json.loads(child.stdout)
+        print('%s: %s' % (size, ', '.join('%s %.3f ms' % (name, stats['median'])
+                                           for name, stats in results['sizes'][size]['callbacks'].items())),
+              file = sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent = 1)
+    else:
+        json.dump(results, sys.stdout, indent = 1)
+
+
+if __name__ == '__main__':
+    main()
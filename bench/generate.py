@@ -0,0 +1,36 @@
+import argparse
+
+from bench import sheets
+
+# --------------------------- Generating Worksheets --------------------------------
+
+# python -m bench.generate worksheets --cities 300 --days 730 --places 40 --responses 100000
+#
+# Writes a CSV file for each worksheet read by the app, with the same layout as the real spreadsheet:
+# probabilities of infection for each city, of adverse effects growing with age and comorbidities,
+# hospital occupancy, a few waves of cases for each city in Prevalence_Live and the places of each city
+# The files can be imported into a copy of the spreadsheet, or served locally with
+# python -m bench.loadtest --data worksheets
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Generate worksheets with as much data as asked for')
+    parser.add_argument('directory', help = 'where to write the CSV files')
+    parser.add_argument('--size', choices = list(sheets.SIZES), default = 'medium',
+                        help = 'preset for the numbers that are not given')
+    parser.add_argument('--cities', type = int)
+    parser.add_argument('--days', type = int, help = 'days of Prevalence_Live history')
+    parser.add_argument('--places', type = int, help = 'places in Transmission for each city')
+    parser.add_argument('--responses', type = int, help = 'number of form responses')
+    parser.add_argument('--seed', type = int, default = 0)
+    args = parser.parse_args()
+
+    sizes = dict(sheets.SIZES[args.size])
+    for name in sizes:
+        if getattr(args, name) is not None:
+            sizes[name] = getattr(args, name)
+    sheets.write(sheets.worksheets(seed = args.seed, **sizes), args.directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+import argparse
+import math
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+
+from bench import sheets
+
+# --------------------------- Checking the Refresh of Prevalence_Live --------------------------------
+
+# python -m bench.livesync --size medium --steps 200
+#
+# Changes the generated Prevalence_Live the way the real one changes, refreshes it after each change and checks
+# that the snapshot served has the same DataFrame and hash as reading the whole worksheet (see data.LiveHistory)
+# Each step either adds a day, changes a value in the top rows, corrects a value in an older row or changes nothing
+# A corrected older row is only read when its rows are audited, so it must be served within
+# (stable rows / LIVE_AUDIT_ROWS) + 1 refreshes rather than at once
+# Exits with an error at the first difference
+
+
+def _whole(data):
+    # The DataFrame and hash of Prevalence_Live read in full
+    values = data.fetch(('live',))[0]['live']
+    return data._frame('live', values, []), values.history.hash
+
+
+def _differs(data):
+    # What differs between the snapshot served and the whole worksheet, None when they are the same
+    snapshot = data.current()
+    frame, digest = _whole(data)
+    if snapshot.hashes['live'] != digest:
+        return 'the hash is %s instead of %s' % (snapshot.hashes['live'], digest)
+    try:
+        pd.testing.assert_frame_equal(snapshot['live'], frame)
+    except AssertionError as e:
+        return str(e)
+    return None
+
+
+def _set(live, row, rng):
+    # Give a cell of active cases or growth rate of the row a new value
+    columns = [column for column, name in enumerate(live[1]) if name.startswith(('active_', 'growth_'))]
+    column = int(rng.choice(columns))
+    live[row][column] = str(int(rng.integers(1, 100000))) if live[1][column].startswith('active_') \
+        else '%.2f' % rng.uniform(0.5, 2)
+    return column
+
+
+def run(size, steps, seed = 0):
+    spreadsheet = sheets.install(size, seed = seed)
+    rng = np.random.default_rng(seed)
+    import data
+    data.load()
+    live = spreadsheet.sheets['Prevalence_Live']
+
+    counts = {'new day': 0, 'top row': 0, 'older row': 0, 'nothing': 0, 'whole reads': 0}
+    for step in range(steps):
+        change = rng.choice(list(counts)[:4], p = [0.4, 0.2, 0.2, 0.2])
+        counts[change] += 1
+        if change == 'new day':
+            sheets.next_day(spreadsheet.sheets, seed + step)
+        elif change == 'top row':
+            _set(live, data.LIVE_HEADER + int(rng.integers(0, 3)), rng)
+        elif change == 'older row':
+            # Below the rows that may still change and the rows that line them up
+            history = data.current().history
+            _set(live, int(rng.integers(data.LIVE_HEADER + len(history.top), len(live))), rng)
+
+        history = data.current().history
+        refreshes = math.ceil(history.stable / data.LIVE_AUDIT_ROWS) + 1 if change == 'older row' else 1
+        for refresh in range(refreshes):
+            cells = spreadsheet.cells
+            data.refresh(('live',))
+            counts['whole reads'] += spreadsheet.cells - cells > len(live) * len(live[1]) // 2
+            difference = _differs(data)
+            if difference is None:
+                break
+        if difference is not None:
+            sys.exit('Step %d (%s): the refreshed Prevalence_Live differs from the whole worksheet after %d '
+                     'refreshes\n%s' % (step, change, refreshes, difference))
+
+    shutil.rmtree(data.SNAPSHOT_DIR, ignore_errors = True)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Check that refreshing Prevalence_Live gives the same data as reading all of it')
+    parser.add_argument('--size', default = 'small', choices = list(sheets.SIZES))
+    parser.add_argument('--steps', type = int, default = 100, help = 'number of changes made to the worksheet')
+    parser.add_argument('--seed', type = int, default = 0)
+    args = parser.parse_args()
+    counts = run(args.size, args.steps, args.seed)
+    print('Prevalence_Live matched the whole worksheet after every change: %s' %
+          ', '.join('%d %s' % (count, name) for name, count in counts.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import numpy as np
+
+import data
+from bench import sheets
+
+# --------------------------- Load Testing the Server --------------------------------
+
+# python -m bench.loadtest --size large --workers 4 --sessions 2000 --concurrency 100
+#
+# Replays the requests made by the browsers of many users at once and reports the latency and throughput
+# of each route and each callback. Each session:
+#   loads the app: GET /, /_dash-layout and /_dash-dependencies
+#   opens one of the pages for a respondent, which runs the page router (index.display_page)
+#   runs every callback of that page once with the values the page starts with, as the browser does
+#   (except those with prevent_initial_call)
+#   changes a dropdown --changes times, picking one of its options, and runs the callbacks that depend on it
+#
+# Without --url the app is started in another process, on the generated worksheets of --size or the ones
+# written by bench/generate.py in --data, and served by serve.py with --workers processes
+# The sessions are run by --concurrency threads. They need some CPU time of their own, so on a small
+# machine the server gets less of it than it would in production
+
+PAGES = ['/pages/riskProfile', '/pages/healthSystem', '/pages/prevalence', '/pages/transmission', '/pages/overall',
+         '/pages/trends']
+
+
+class Results:
+
+    def __init__(self):
+        self.times = {} # Route or callback: seconds taken by each request
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, seconds, ok):
+        with self.lock:
+            self.times.setdefault(name, []).append(seconds)
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+    def summary(self, duration):
+        summary = {}
+        for name, times in sorted(self.times.items()):
+            times = np.array(times) * 1000
+            summary[name] = {'requests': len(times), 'errors': self.errors.get(name, 0),
+                             'p50': np.percentile(times, 50), 'p99': np.percentile(times, 99), 'mean': times.mean(),
+                             'throughput': len(times) / duration}
+        return summary
+
+
+def _key(id):
+    # Ids that are dictionaries (pattern matching) are written the way Dash writes them in the dependencies
+    return json.dumps(id, sort_keys = True, separators = (',', ':')) if isinstance(id, dict) else id
+
+
+def _matches(pattern, id):
+    # Whether the id of a component matches a wildcard id such as {"index":["ALL"],"type":"hh_age"}
+    return isinstance(id, dict) and id.keys() == pattern.keys() and \
+        all(isinstance(value, list) or id[key] == value for key, value in pattern.items())
+
+
+def _components(layout, found):
+    # The components in a layout that have an id, keyed by their id
+    if isinstance(layout, list):
+        for child in layout:
+            _components(child, found)
+    elif isinstance(layout, dict) and 'props' in layout:
+        props = layout['props']
+        if 'id' in props:
+            found[_key(props['id'])] = props
+        _components(props.get('children'), found)
+    return found
+
+
+class Session:
+    # One user going through the app, keeping the values of the components like their browser does
+
+    def __init__(self, connection, results, rng):
+        self.connection = connection
+        self.results = results
+        self.rng = rng
+        self.values = {} # (component id, property): value
+        self.components = {}
+
+    def request(self, name, method, path, body = None):
+        start = time.perf_counter()
+        ok = False
+        try:
+            headers = {'Content-Type': 'application/json'} if body is not None else {}
+            self.connection.request(method, path, body = body and json.dumps(body), headers = headers)
+            response = self.connection.getresponse()
+            content = response.read()
+            ok = response.status in (200, 204)
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            content = b''
+        self.results.add(name, time.perf_counter() - start, ok)
+        return content if ok else None
+
+    def value(self, dependency):
+        # The value sent for an input or state, a list of the values of every matching component for a wildcard id
+        if not dependency['id'].startswith('{'):
+            return dict(dependency, value = self.values.get((dependency['id'], dependency['property'])))
+        pattern = json.loads(dependency['id'])
+        return [{'id': props['id'], 'property': dependency['property'], 'value': props.get(dependency['property'])}
+                for props in self.components.values() if _matches(pattern, props['id'])]
+
+    def call(self, callback, changed):
+        # Run a callback the way the browser does and keep the values of its outputs
+        outputs = callback['outputs']
+        body = {
+            'output': callback['output'],
+            'outputs': outputs if callback['multi'] else outputs[0],
+            'inputs': [self.value(dependency) for dependency in callback['inputs']],
+            'state': [self.value(dependency) for dependency in callback['state']],
+            'changedPropIds': ['%s.%s' % changed]
+        }
+        content = self.request(callback['name'], 'POST', '/_dash-update-component', body)
+        if content:
+            response = json.loads(content)['response']
+            for id, props in response.items():
+                for prop, value in props.items():
+                    self.values[(id, prop)] = value
+                    if prop == 'children':
+                        for child, child_props in _components(value, {}).items():
+                            self.components[child] = child_props
+                            for name, child_value in child_props.items():
+                                self.values[(child, name)] = child_value
+            return response
+        return None
+
+    def run(self, callbacks, respondents, changes):
+        self.request('GET /', 'GET', '/')
+        self.request('GET /_dash-layout', 'GET', '/_dash-layout')
+        self.request('GET /_dash-dependencies', 'GET', '/_dash-dependencies')
+
+        self.values[('url', 'pathname')] = self.rng.choice(PAGES)
+        self.values[('url', 'search')] = '?id=' + self.rng.choice(respondents) if respondents else ''
+        router = [callback for callback in callbacks if callback['output'].startswith('..page-content.')][0]
+        if self.call(router, ('url', 'pathname')) is None:
+            return
+
+        # The callbacks of the page that was opened, and the dropdowns the user can change
+        # Like the browser, only the callbacks whose inputs and outputs are all on the page are run
+        # Wildcard inputs can match any number of components, none included
+        page = [callback for callback in callbacks if callback is not router
+                and all(dependency['id'] in self.components or dependency['id'].startswith('{')
+                        for dependency in callback['inputs'] + callback['outputs'])]
+        for callback in page:
+            if not callback.get('prevent_initial_call'):
+                self.call(callback, (callback['inputs'][0]['id'], callback['inputs'][0]['property']))
+        dropdowns = [(callback, dependency) for callback in page for dependency in callback['inputs']
+                     if dependency['property'] == 'value' and dependency['id'] in self.components
+                     and self.components[dependency['id']].get('options')]
+
+        for change in range(changes):
+            if not dropdowns:
+                break
+            callback, dependency = self.rng.choice(dropdowns)
+            options = self.components[dependency['id']]['options']
+            self.values[(dependency['id'], dependency['property'])] = self.rng.choice(options)['value']
+            for callback in page:
+                if dependency in callback['inputs']:
+                    self.call(callback, (dependency['id'], dependency['property']))
+
+
+def _callbacks(dependencies):
+    # The callbacks run on the server, with the outputs split the way the browser sends them
+    callbacks = []
+    for dependency in dependencies:
+        if dependency.get('clientside_function'):
+            continue
+        multi = dependency['output'].startswith('..')
+        outputs = []
+        for output in dependency['output'].strip('.').split('...'):
+            id, prop = output.rsplit('.', 1)
+            outputs.append({'id': id, 'property': prop})
+        callbacks.append(dict(dependency, outputs = outputs, multi = multi,
+                              name = '%s.%s' % (outputs[0]['id'], outputs[0]['property'])))
+    return callbacks
+
+
+def _respondents(args):
+    # Some of the respondents in the form responses served, so that the pages are opened for them
+    if args.url:
+        return []
+    if args.data:
+        rows = sheets.read(args.data)[data.WORKSHEETS['responses']][1:1001]
+        return [row[1] for row in rows]
+    return [sheets.RESPONDENT % i for i in range(min(sheets.SIZES[args.size]['responses'], 1000))]
+
+
+def _serve(args):
+    # Started in another process: serve the app on the generated worksheets
+    sheets.install(args.size, seed = args.seed, directory = args.data)
+    import index
+    import serve
+    data.current()
+    try:
+        serve.Server(index.server, {
+            'bind': '127.0.0.1:%d' % args.port,
+            'workers': args.workers,
+            'threads': args.threads,
+            'worker_class': 'gthread',
+            'preload_app': True,
+            'loglevel': 'warning',
+            'post_fork': serve.post_fork
+        }).run()
+    finally:
+        shutil.rmtree(data.SNAPSHOT_DIR, ignore_errors = True)
+
+
+def _wait(host, port, server, timeout = 120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError('The server stopped')
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout = 5)
+            connection.request('GET', '/_dash-layout')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError('The server did not start within %d seconds' % timeout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Replay the requests of many users at once')
+    parser.add_argument('--url', help = 'server to test, otherwise one is started on generated worksheets')
+    parser.add_argument('--size', choices = list(sheets.SIZES), default = 'medium')
+    parser.add_argument('--data', help = 'directory of worksheets written by bench.generate')
+    parser.add_argument('--workers', type = int, default = 2, help = 'server processes')
+    parser.add_argument('--threads', type = int, default = 8, help = 'threads in each server process')
+    parser.add_argument('--sessions', type = int, default = 500, help = 'number of users')
+    parser.add_argument('--concurrency', type = int, default = 50, help = 'number of users at the same time')
+    parser.add_argument('--changes', type = int, default = 5, help = 'dropdowns changed by each user')
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--port', type = int, default = 8051)
+    parser.add_argument('--output', help = 'file to write the results to as JSON')
+    parser.add_argument('--serve', action = 'store_true', help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        return _serve(args)
+
+    server = None
+    url = urlsplit(args.url or 'http://127.0.0.1:%d' % args.port)
+    if not args.url:
+        server = subprocess.Popen([sys.executable, '-m', 'bench.loadtest', '--serve'] + sys.argv[1:])
+    try:
+        _wait(url.hostname, url.port or 80, server)
+        connection = http.client.HTTPConnection(url.hostname, url.port or 80)
+        connection.request('GET', '/_dash-dependencies')
+        callbacks = _callbacks(json.loads(connection.getresponse().read()))
+        respondents = _respondents(args)
+
+        results = Results()
+        local = threading.local()
+
+        def session(number):
+            if not hasattr(local, 'connection'):
+                local.connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout = 60)
+            Session(local.connection, results, random.Random(args.seed * 1000003 + number)).run(
+                callbacks, respondents, args.changes)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            list(pool.map(session, range(args.sessions)))
+        duration = time.perf_counter() - start
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    summary = results.summary(duration)
+    total = sum(stats['requests'] for stats in summary.values())
+    print('%d sessions, %d requests in %.1f s (%.0f requests/s)' % (args.sessions, total, duration, total / duration))
+    print('%-45s %9s %7s %9s %9s %9s' % ('', 'requests', 'errors', 'p50 ms', 'p99 ms', 'req/s'))
+    for name, stats in summary.items():
+        print('%-45s %9d %7d %9.1f %9.1f %9.1f' % (name[:45], stats['requests'], stats['errors'],
+                                                   stats['p50'], stats['p99'], stats['throughput']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'arguments': {name: value for name, value in vars(args).items() if name != 'serve'},
+                       'duration': duration, 'cpus': os.cpu_count(), 'results': summary}, f, indent = 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+import csv
+import glob
+import os
+import re
+import tempfile
+
+import gspread
+import numpy as np
+
+import data
+
+# --------------------------- A Stand-in for the Google Sheet --------------------------------
+
+# The benchmarks run against worksheets generated here instead of the real spreadsheet,
+# so they need no credentials or network and always see the same data for the same size
+# The worksheets have the same layout as the real ones, only with as many cities, days, places and
+# form responses as asked for
+
+# The number of cities, days of live data, places per city and form responses of each size
+SIZES = {
+    'small': {'cities': 2, 'days': 60, 'places': 5, 'responses': 100},
+    'medium': {'cities': 50, 'days': 365, 'places': 20, 'responses': 10000},
+    'large': {'cities': 500, 'days': 1000, 'places': 50, 'responses': 200000}
+}
+
+# Places people go to, their type and how likely the virus is to spread there
+PLACES = [
+    ('Bus', 'Transport', 25), ('Train', 'Transport', 22), ('Auto rickshaw', 'Transport', 12),
+    ('Office', 'Indoor', 20), ('Restaurant', 'Indoor', 24), ('Gym', 'Indoor', 26), ('Cinema', 'Indoor', 28),
+    ('Temple', 'Indoor', 18), ('Hospital', 'Indoor', 15), ('Salon', 'Indoor', 19), ('Mall', 'Indoor', 17),
+    ('Market', 'Outdoor', 10), ('Park', 'Outdoor', 3), ('Beach', 'Outdoor', 4), ('Street food stall', 'Outdoor', 8)
+]
+RESPONDENT = 'respondent%d' # The IDs of the respondents in the form responses
+
+
+def _index(letters):
+    # The position of a column given in A1 notation, starting from 0 for A
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+def _epidemic(rng, days):
+    # Daily new cases of one city over days, oldest first: a few waves of different size and length
+    t = np.arange(days)
+    population = rng.lognormal(13, 1) # Cities of a few thousand to a few million people
+    new = np.zeros(days)
+    for wave in range(rng.integers(1, 4)):
+        peak = rng.uniform(0, days)
+        width = rng.uniform(10, 60)
+        new += population * rng.uniform(0.0001, 0.002) * np.exp(-0.5 * ((t - peak) / width) ** 2)
+    return rng.poisson(new + 1)
+
+
+def _city(rng, days):
+    # The active cases and growth rate of one city on each day, the latest day first
+    new = _epidemic(rng, days)
+    active = np.convolve(new, np.ones(14, dtype = int))[:days] # Cases of the last 14 days
+    weekly = np.convolve(new, np.ones(7, dtype = int))[:days]
+    growth = np.zeros(days)
+    growth[7:] = 100 * (weekly[7:] / np.maximum(weekly[:-7], 1) - 1) / 7 # Average daily growth over a week
+    active, growth = [str(value) for value in active[::-1]], ['%.2f' % value for value in growth[::-1]]
+
+    # The latest values of some cities are not known yet and cities that started reporting later
+    # have no values for the earliest days
+    late = rng.integers(0, 4)
+    start = days - rng.integers(0, days // 4 + 1)
+    for day in list(range(late)) + list(range(start, days)):
+        active[day] = growth[day] = 'NA'
+    return active, growth
+
+
+def _live(rng, cities, days):
+    # Columns K to P always hold three cities and Q to S are not used, any other cities come after S
+    names, columns = [], []
+    for city in range(1, max(cities, 3) + 1):
+        names += ['active_%d' % city, 'growth_%d' % city]
+        columns += _city(rng, days)
+    names = names[:6] + ['y1', 'y2', 'y3'] + names[6:]
+    columns = columns[:6] + [[''] * days] * 3 + columns[6:]
+
+    header = ['Date'] + ['x%d' % i for i in range(1, 10)] + names
+    live = [['Prevalence_Live'] + [''] * (len(header) - 1), header]
+    for day in range(days):
+        live.append(['day %d' % (days - day)] + [''] * 9 + [column[day] for column in columns])
+    return live
+
+
+def next_day(sheets, seed = 0):
+    # Add a day at the top of Prevalence_Live the way the sheet grows every day: the values of the latest days that
+    # weren't known yet are filled in, and the values of the new day are known for most of the cities
+    rng = np.random.default_rng(seed)
+    live = sheets['Prevalence_Live']
+    day = ['day %d' % (len(live) - 1)] + [''] * (len(live[1]) - 1)
+    for column, name in enumerate(live[1]):
+        if not name.startswith(('active_', 'growth_')):
+            continue
+        known = next((row for row in range(2, len(live)) if live[row][column] != 'NA'), None)
+        if known is None:
+            day[column] = 'NA'
+            continue
+        for row in range(2, known):
+            live[row][column] = live[known][column]
+        value = float(live[known][column]) * rng.uniform(0.9, 1.1)
+        day[column] = 'NA' if rng.random() < 0.2 else (str(int(value)) if name.startswith('active_') else '%.2f' % value)
+    live.insert(2, day)
+
+
+def worksheets(cities, days, places, responses, seed = 0):
+    # The values of every worksheet read by data.py, as the Sheets API returns them: lists of rows of strings
+    rng = np.random.default_rng(seed)
+    codes = range(1, cities + 1)
+
+    sheets = {}
+    sheets['P_inf'] = [['Gender', 'City_code', 'Prob']] + \
+        [[str(gender), str(city), '%.4f' % rng.uniform(0.001, 0.1)] for gender in (1, 2) for city in codes]
+    # Older people and people with comorbidities are more likely to have an adverse effect
+    sheets['P_adverse'] = [['Age', 'Diabetes', 'Hypertension', 'Hosp', 'Death']] + \
+        [[str(age), str(diabetes), str(hyper), '%.4f' % (0.02 * age * (1 + diabetes + hyper) * rng.uniform(0.8, 1.2)),
+          '%.4f' % (0.002 * age ** 2 * (1 + diabetes + hyper) * rng.uniform(0.8, 1.2))]
+         for age in (1, 2, 3) for diabetes in (0, 1) for hyper in (0, 1)]
+    sheets['HealthSystem'] = [['City_code', 'Beds', 'ICU']] + \
+        [[str(city), '%.1f' % beds, '%.1f' % min(100, beds * rng.uniform(0.8, 1.5))]
+         for city, beds in zip(codes, rng.beta(2, 3, cities) * 100)]
+    sheets['Prevalence'] = [['City_code', 'Prevalence']] + [[str(city), '%.3f' % rng.beta(2, 8)] for city in codes]
+    sheets['Prevalence_Live'] = _live(rng, cities, days)
+
+    sheets['Transmission'] = [['City_code', 'Place', 'Type', 'Transmission']]
+    for city in codes:
+        for place in range(places):
+            name, kind, transmission = PLACES[place % len(PLACES)]
+            if place >= len(PLACES):
+                name = '%s %d' % (name, place // len(PLACES) + 1)
+            sheets['Transmission'].append([str(city), name, kind, '%.1f' % (transmission * rng.uniform(0.5, 1.5))])
+
+    # ID strings only have one digit for the city, so only the first 9 cities can be given in the form
+    ids = ['%d%d%d%d%d' % row for row in zip(rng.integers(1, 3, responses), rng.integers(1, min(cities, 9) + 1, responses),
+                                             rng.choice([1, 2, 3], responses, p = [0.3, 0.5, 0.2]),
+                                             rng.random(responses) < 0.1, rng.random(responses) < 0.2)]
+    sheets[data.WORKSHEETS['responses']] = [['Timestamp', data.RESPONDENT_COLUMN, data.ID_COLUMN]] + \
+        [['', RESPONDENT % i, id_string] for i, id_string in enumerate(ids)]
+    sheets['Looking up latest'] = [[''] * 6, [''] * 5 + [ids[-1] if ids else '11100']]
+    return sheets
+
+
+def write(sheets, directory):
+    # Save each worksheet as a CSV file named after it, eg. to import them into a copy of the spreadsheet
+    os.makedirs(directory, exist_ok = True)
+    for name, rows in sheets.items():
+        with open(os.path.join(directory, name + '.csv'), 'w', newline = '') as f:
+            csv.writer(f).writerows(rows)
+
+
+def read(directory):
+    sheets = {}
+    for path in glob.glob(os.path.join(directory, '*.csv')):
+        with open(path, newline = '') as f:
+            sheets[os.path.basename(path)[:-len('.csv')]] = list(csv.reader(f))
+    return sheets
+
+
+class _Response:
+    # The parts of an HTTP response gspread reads when it raises an APIError
+
+    def __init__(self, code, message):
+        self.text = message
+        self.code = code
+
+    def json(self):
+        return {'error': {'code': self.code, 'message': self.text}}
+
+
+class Spreadsheet:
+    # Answers the requests data.py makes to a gspread Spreadsheet from the worksheets held in memory
+    # Every request is counted, as each one would be a call to the Sheets API, and so is every cell sent back
+    # Like the Sheets API, a request naming a worksheet that doesn't exist fails as a whole
+
+    def __init__(self, sheets):
+        self.sheets = sheets
+        self.requests = 0
+        self.cells = 0
+
+    def _range(self, a1):
+        # Only the ranges data.py asks for: a whole worksheet, a cell, whole rows such as 'Prevalence_Live'!2:2,
+        # or a block of columns and rows such as 'Prevalence_Live'!K3:P where the end row may be left out
+        match = re.fullmatch(r"'(.+)'(?:!([A-Z]*)(\d+)(?::([A-Z]*)(\d*))?)?", a1)
+        name, first_column, first_row, last_column, last_row = match.groups()
+        if name not in self.sheets:
+            raise gspread.exceptions.APIError(_Response(400, 'Unable to parse range: %s' % a1))
+        rows = self.sheets[name]
+        if first_row:
+            if match.group(4) is None: # A single cell
+                last_column, last_row = first_column, first_row
+            first = _index(first_column) if first_column else 0
+            last = _index(last_column) + 1 if last_column else None
+            rows = [row[first:last] for row in rows[int(first_row) - 1:int(last_row) if last_row else len(rows)]]
+
+        # Like the Sheets API, leave out empty cells at the end of the rows and empty rows at the end
+        values = []
+        for row in rows:
+            row = list(row)
+            while row and row[-1] == '':
+                row.pop()
+            values.append(row)
+        while values and not values[-1]:
+            values.pop()
+        self.cells += sum(len(row) for row in values)
+        return {'range': a1, 'majorDimension': 'ROWS', 'values': values} if values else {'range': a1}
+
+    def values_batch_get(self, ranges, params = None):
+        self.requests += 1
+        return {'valueRanges': [self._range(a1) for a1 in ranges]}
+
+    def values_get(self, range, params = None):
+        self.requests += 1
+        return self._range(range)
+
+
+def install(size = 'small', seed = 0, directory = None):
+    # Make data.py read the generated worksheets, or the ones saved in directory, before any data is loaded
+    # The snapshots are saved to a new temporary directory, so the one of the real sheet is never used
+    spreadsheet = Spreadsheet(read(directory) if directory else worksheets(seed = seed, **SIZES[size]))
+    data._sheet = spreadsheet
+    data.SNAPSHOT_DIR = tempfile.mkdtemp(prefix = 'bench-snapshot-')
+    return spreadsheet
@@ -0,0 +1,151 @@
+import functools
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import data
+
+# --------------------------- Caching the Results of Callbacks --------------------------------
+
+# Many callbacks return the same outputs for every user who selects the same inputs, eg. the same city
+# Their results are kept here, keyed by the callback, its inputs and the version of the worksheets it reads
+# so a result is never served for data other than the data it was computed from
+#
+# The most recently used CALLBACK_CACHE_SIZE results are kept in memory by each process
+# When CALLBACK_CACHE_PATH is set the results are also kept in a SQLite file there, shared by all the processes
+
+CACHE_SIZE = int(os.environ.get('CALLBACK_CACHE_SIZE', 1024))
+CACHE_PATH = os.environ.get('CALLBACK_CACHE_PATH')
+
+
+class _Store:
+    # The results shared by the processes, evicted in least recently used order as well
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self.local = threading.local() # sqlite connections can't be shared between threads
+        with self._connection() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, deps TEXT, value BLOB, used REAL)')
+
+    def _connection(self):
+        # Connections are opened after the server has forked its workers and never shared between processes
+        if getattr(self.local, 'pid', None) != os.getpid():
+            self.local.db = sqlite3.connect(self.path, timeout = 5, isolation_level = None)
+            self.local.db.execute('PRAGMA journal_mode=WAL')
+            self.local.pid = os.getpid()
+        return self.local.db
+
+    def get(self, key):
+        db = self._connection()
+        row = db.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        db.execute('UPDATE results SET used = ? WHERE key = ?', (time.time(), key))
+        return pickle.loads(row[0])
+
+    def put(self, key, deps, value):
+        db = self._connection()
+        db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                   (key, ' '.join(deps), pickle.dumps(value, protocol = pickle.HIGHEST_PROTOCOL), time.time()))
+        db.execute('DELETE FROM results WHERE key NOT IN (SELECT key FROM results ORDER BY used DESC LIMIT ?)', (self.size,))
+
+    def invalidate(self, names):
+        db = self._connection()
+        for name in names:
+            db.execute("DELETE FROM results WHERE ' ' || deps || ' ' LIKE ?", ('% ' + name + ' %',))
+
+
+class ResultCache:
+
+    def __init__(self, size = CACHE_SIZE, path = CACHE_PATH):
+        self.size = size
+        self.entries = OrderedDict() # key: (worksheets the result depends on, result)
+        self.lock = threading.Lock()
+        self.store = _Store(path, size) if path else None
+        self.counts = {} # callback name: [hits, misses]
+
+    def _count(self, name, hit):
+        with self.lock:
+            counts = self.counts.setdefault(name, [0, 0])
+            counts[0 if hit else 1] += 1
+
+    def get(self, name, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+        if entry is None and self.store is not None:
+            value = self.store.get(key)
+            if value is not None:
+                entry = value
+                self._put_local(key, *entry)
+        self._count(name, entry is not None)
+        return entry
+
+    def _put_local(self, key, deps, value):
+        with self.lock:
+            self.entries[key] = (deps, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last = False)
+
+    def put(self, key, deps, value):
+        self._put_local(key, deps, value)
+        if self.store is not None:
+            self.store.put(key, deps, (deps, value))
+
+    def invalidate(self, names):
+        # Drop the results that depend on any of the given worksheets
+        names = set(names)
+        with self.lock:
+            stale = [key for key, (deps, value) in self.entries.items() if names.intersection(deps)]
+            for key in stale:
+                del self.entries[key]
+        if self.store is not None:
+            self.store.invalidate(names)
+
+    def stats(self):
+        # Hits and misses of each callback and the number of results kept in memory
+        with self.lock:
+            return {'size': len(self.entries),
+                    'callbacks': {name: {'hits': hits, 'misses': misses} for name, (hits, misses) in self.counts.items()}}
+
+    def memoize(self, *worksheets):
+        # Cache the results of a callback that only reads the given worksheets (named as in data.WORKSHEETS)
+        # Place it below @app.callback
+        def decorator(callback):
+            name = callback.__module__ + '.' + callback.__name__
+
+            @functools.wraps(callback)
+            def wrapper(*args):
+                snapshot = data.current()
+                versions = [snapshot.hashes[worksheet] for worksheet in worksheets]
+                key = json.dumps([name, args, versions], default = str)
+
+                entry = self.get(name, key)
+                if entry is not None:
+                    return entry[1]
+                value = callback(*args)
+                self.put(key, worksheets, value)
+                return value
+
+            return wrapper
+        return decorator
+
+
+results = ResultCache()
+
+
+@data.subscribe
+def _invalidate(old, new):
+    # Only the results computed from worksheets that changed are dropped
+    results.invalidate([name for name in new.hashes if new.hashes[name] != old.hashes.get(name)])
+
+
+memoize = results.memoize
+stats = results.stats
@@ -0,0 +1,67 @@
+import bisect
+
+import data
+from indicators import latest_values
+
+# --------------------------- The Cities in the Sheets --------------------------------
+
+# Every city that every page can show, with its name: a city must have rows in P_inf (Risk Profile) and
+# HealthSystem (Health System Response) and known values in Prevalence_Live (Prevalence and Trends)
+# Places in Transmission are optional, the pages use DEFAULT_TRANSMISSION for a city without any (see indicators.py)
+# A city selected in the form that isn't listed can still be shown, and the pages say which of its data is missing
+# The name is taken from a 'City' column in HealthSystem when there is one, then from NAMES,
+# otherwise the city is called by its code
+# Names can be searched by the start of any of their words, so the dropdowns only ever hold a few cities
+
+NAMES = {1: 'Delhi', 2: 'Chennai'}
+SEARCH_LIMIT = 50 # Most cities given as options at once
+
+REQUIRED = ('p_inf', 'healthsys') # The worksheets a city must have rows in
+
+
+class CityCatalogue:
+
+    def __init__(self, names):
+        self.names = names # City code: name
+
+        # The start of every word of every name in lower case, sorted so that a search is a binary search
+        keys = []
+        for code, name in names.items():
+            name = name.lower()
+            keys += [(name[i:], name, code) for i in range(len(name)) if i == 0 or name[i - 1] == ' ']
+        keys.sort()
+        self._keys = [key for key, name, code in keys]
+        self._codes = [(name, code) for key, name, code in keys]
+
+    def name(self, code):
+        return self.names.get(code, 'City %d' % code)
+
+    def option(self, code):
+        return {'label': self.name(code), 'value': code}
+
+    def search(self, text = '', limit = SEARCH_LIMIT):
+        # The options of the cities whose name has a word starting with text, in alphabetical order
+        text = text.strip().lower()
+        found = {}
+        if text.isdigit() and int(text) in self.names:
+            found[int(text)] = self.names[int(text)].lower() # Cities can also be found by their code
+        i = bisect.bisect_left(self._keys, text)
+        while i < len(self._keys) and len(found) < limit and self._keys[i].startswith(text):
+            name, code = self._codes[i]
+            found[code] = name
+            i += 1
+        return [self.option(code) for code in sorted(found, key = lambda code: (found[code], code))]
+
+
+@data.derived
+def city_catalogue(snapshot):
+    codes = set(snapshot.get(latest_values)) # The cities with known values in Prevalence_Live
+    for name in REQUIRED:
+        codes.intersection_update(snapshot[name]['City_code'].unique().tolist())
+
+    names = {code: NAMES.get(code, 'City %d' % code) for code in codes}
+    healthsys = snapshot['healthsys']
+    if 'City' in healthsys.columns:
+        names.update((code, name) for code, name in zip(healthsys['City_code'].tolist(), healthsys['City'].str.strip())
+                     if code in codes)
+    return CityCatalogue(names)
@@ -0,0 +1,821 @@
+import fnmatch
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+import gspread
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pyarrow import feather
+
+log = logging.getLogger(__name__)
+
+# --------------------------- Shared Access to the Google Sheet --------------------------------
+
+# Every page reads its data from here instead of opening the spreadsheet on its own
+# All the worksheets are fetched together in a single batched request to the Sheets API
+
+SHEET_KEY = '1TFvNZqHILzKK7VttupYZgrSNgiZXkGlEicvc50VhGvM'
+CREDENTIALS = 'cred.json'
+
+# The worksheets used by the pages, keyed by the name of the DataFrame built from each of them
+WORKSHEETS = {
+    'p_inf': 'P_inf',
+    'p_adv': 'P_adverse',
+    'healthsys': 'HealthSystem',
+    'prev': 'Prevalence',
+    'live': 'Prevalence_Live',
+    'transmission': 'Transmission',
+    'responses': os.environ.get('RESPONSES_SHEET', 'Form Responses 1')
+}
+LATEST = "'Looking up latest'!F2" # ID string of the latest form response is stored in the F2 cell
+
+# The columns of the form responses with the ID of the respondent and the ID string generated from their answers
+RESPONDENT_COLUMN = os.environ.get('RESPONDENT_COLUMN', 'Respondent')
+ID_COLUMN = os.environ.get('ID_COLUMN', 'ID')
+
+# The last data loaded is saved here so that a restart doesn't have to wait for the Sheets API
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', 'snapshot')
+FORMAT_VERSION = 3 # Increase this whenever the DataFrames built from the worksheets change shape
+
+# The worksheets that change during the day are fetched again in the background every REFRESH_SECONDS
+# Setting it to 0 turns the background refresh off
+REFRESH_SECONDS = float(os.environ.get('REFRESH_SECONDS', 300))
+REFRESHED = ('healthsys', 'live', 'transmission', 'responses')
+WATCH_SECONDS = float(os.environ.get('WATCH_SECONDS', 5)) # How often processes that don't fetch the sheet look for a newer snapshot, see watch()
+RETRIES = 5 # Number of attempts when the Sheets API answers with a quota or server error
+RETRY_DELAY = 2.0 # Seconds to wait after the first failed attempt, doubled after every other one
+# Refreshes only read the latest rows of Prevalence_Live, it is read in full again every LIVE_FULL_SECONDS (see LiveHistory)
+LIVE_FULL_SECONDS = float(os.environ.get('LIVE_FULL_SECONDS', 24 * 60 * 60))
+
+_sheet = None # The spreadsheet is opened once and shared by every fetch
+_snapshot = None # The data currently served to the pages
+_lock = threading.Lock()
+_update_lock = threading.Lock() # Only one fetch at a time may replace the snapshot, readers never wait for it
+_derivations = [] # Functions computing lookup tables and indexes from each snapshot, see derived()
+_listeners = [] # Functions called whenever a new snapshot is served, see subscribe()
+
+
+def _reset_locks():
+    # A process forked while another thread held a lock would otherwise never be able to take it
+    global _lock, _update_lock
+    _lock = threading.Lock()
+    _update_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child = _reset_locks)
+
+
+def spreadsheet():
+    global _sheet
+    if _sheet is None:
+        gc = gspread.service_account(filename = CREDENTIALS)
+        _sheet = gc.open_by_key(SHEET_KEY)
+    return _sheet
+
+
+def _pad(rows):
+    # The Sheets API leaves out trailing empty cells, so rows can have different lengths
+    # Pad them with empty strings the way worksheet.get_all_values() does
+    width = max((len(row) for row in rows), default = 0)
+    return [row + [''] * (width - len(row)) for row in rows]
+
+
+def _hash(values):
+    return hashlib.sha256(json.dumps(values).encode()).hexdigest()
+
+
+def fetch(names = tuple(WORKSHEETS), since = None):
+    # Get the values of the requested worksheets and the latest ID string in one request
+    # Given the snapshot being served, only the rows of Prevalence_Live that may have changed since it was read are requested
+    history = since.history if since is not None and 'live' in names else None
+    if history is not None and history.expired():
+        history = None
+    whole = [name for name in names if name != 'live' or history is None]
+    ranges = ["'%s'" % WORKSHEETS[name] for name in whole] + [LATEST]
+    if history is not None:
+        ranges += history.ranges()
+    try:
+        value_ranges = spreadsheet().values_batch_get(ranges)['valueRanges']
+    except gspread.exceptions.APIError as e:
+        # The Sheets API rejects the whole request when a range names a worksheet that doesn't exist
+        # The form responses are optional (see _responses), so they are left out rather than failing the load
+        if e.code != 400 or 'responses' not in whole:
+            raise
+        log.warning("Could not read worksheet '%s' (%s), no respondent can be looked up", WORKSHEETS['responses'], e)
+        values, latest = fetch([name for name in names if name != 'responses'], since)
+        values['responses'] = []
+        return {name: values[name] for name in names}, latest
+
+    values = {name: _pad(vr.get('values', [])) for name, vr in zip(whole, value_ranges)}
+    latest = value_ranges[len(whole)].get('values', [['']])
+    if 'live' in values:
+        values['live'] = LiveUpdate.read(values['live'])
+    elif history is not None:
+        values['live'] = history.sync(value_ranges[len(whole) + 1:])
+        if values['live'] is None: # The header has changed or the rows can't be lined up with the ones read before
+            log.info('Reading the whole of %s again', WORKSHEETS['live'])
+            values['live'] = fetch(('live',))[0]['live']
+    return {name: values[name] for name in names}, latest[0][0]
+
+
+def _fetch_with_retry(names = tuple(WORKSHEETS), since = None):
+    delay = RETRY_DELAY
+    for attempt in range(RETRIES):
+        try:
+            return fetch(names, since)
+        except gspread.exceptions.APIError as e:
+            # 429 is returned when the quota is used up, the 5xx errors are usually temporary
+            if e.code not in (429, 500, 502, 503) or attempt == RETRIES - 1:
+                raise
+            log.warning('Sheets API error %s, retrying in %.0f seconds', e.code, delay)
+            time.sleep(delay * (1 + random.random())) # The random part keeps several processes from retrying together
+            delay *= 2
+
+
+def _digest(values):
+    # Prevalence_Live is hashed row by row as it is read (see LiveHistory)
+    return values.history.hash if isinstance(values, LiveUpdate) else _hash(values)
+
+
+def changed(values, snapshot):
+    # The names of the worksheets whose values differ from the ones in the snapshot
+    return [name for name in values if _digest(values[name]) != snapshot.hashes.get(name)]
+
+
+# --------------------------- Syncing Prevalence_Live --------------------------------
+
+# Prevalence_Live grows by a row every day. The latest day is at the top, right below the title and header rows,
+# and its values are filled in over the next few days while the rows below no longer change
+# So once it has been read in full, a refresh only requests:
+#   the header row, to notice cities being added
+#   the top rows of the columns of active cases and growth rates: the rows that may still change,
+#   room for LIVE_NEW_ROWS new days and LIVE_OVERLAP rows that were read before
+#   LIVE_AUDIT_ROWS of the rows that no longer change, a different stretch of them each time (see below)
+# The LIVE_OVERLAP rows line up the rows read with the ones read before. Only the rows above them are converted
+# and put on top of the DataFrame of the snapshot being served, and its hash is extended by them,
+# so the time and the quota a refresh takes depend on the number of new rows rather than on the length of the history
+# The whole worksheet is read again when the rows can't be lined up (eg. the sheet wasn't refreshed for more than
+# LIVE_NEW_ROWS days), when the header changes, when an audited row differs and every LIVE_FULL_SECONDS
+#
+# A correction to an older row is only noticed once the stretch of rows audited reaches it, as the rows below the
+# overlap aren't otherwise read. The stretches go from the oldest row to the newest and start again, so a correction
+# is served after at most (stable rows / LIVE_AUDIT_ROWS) refreshes, eg. 19 refreshes of REFRESH_SECONDS for a year
+# of days, or LIVE_FULL_SECONDS if that is sooner. Until then the pages show the values read before
+
+LIVE_HEADER = 2 # Rows above the data: the name of the worksheet and the column names
+LIVE_COLUMNS = (10, 16, 19) # The columns read: K to P (10 to 15) and every column from T (19) on
+LIVE_NEW_ROWS = 7
+LIVE_OVERLAP = 3
+LIVE_AUDIT_ROWS = 20
+
+
+def _live_columns(rows):
+    # Only the columns of active case number and growth rate, the others are only used by the formulas in the sheet
+    first, end, rest = LIVE_COLUMNS
+    return [row[first:end] + row[rest:] for row in rows]
+
+
+def _letters(index):
+    # The A1 notation of a column given its position, starting from 0 for A
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def _changing(rows):
+    # The number of rows at the top with values that aren't known yet, which may still be filled in
+    count = 0
+    while count < len(rows) and any(cell in MISSING for cell in rows[count]):
+        count += 1
+    return count
+
+
+def _extend(digest, rows):
+    # The rows are hashed oldest first, so that the hash of the history can be extended by the new days
+    # Returns the hash of each row, oldest first, which the audited rows are compared with
+    hashes = []
+    for row in reversed(rows):
+        row = json.dumps(row).encode()
+        digest.update(row)
+        hashes.append(hashlib.sha256(row).digest())
+    return hashes
+
+
+def _join(value_ranges, widths, height):
+    # The blocks of columns read for the same rows put back side by side, with the cells left out by the Sheets API
+    rows = [[] for row in range(height)]
+    for vr, width in zip(value_ranges, widths):
+        block = vr.get('values', [])[:height]
+        for row, cells in zip(rows, block + [[]] * (height - len(block))):
+            row += cells + [''] * (width - len(cells))
+    return rows
+
+
+class LiveHistory:
+    # What a refresh needs to know about the rows of Prevalence_Live read for a snapshot, newest first
+    #   header: the rows above the data
+    #   changing: the number of rows at the top that may still change
+    #   top: those rows and the LIVE_OVERLAP rows below them
+    #   stable: the number of rows below the ones that may still change
+    #   digest: the hash of the header and of the stable rows, before the rows that may still change are added
+    #   read: when the whole worksheet was last read
+    #   hashes: the hash of each stable row, oldest first
+    #   audit: the first of the stable rows (oldest first) audited by the next refresh
+
+    def __init__(self, header, changing, top, stable, digest, read, hashes, audit = 0):
+        self.header = header
+        self.changing = changing
+        self.top = top
+        self.stable = stable
+        self.digest = digest
+        self.read = read
+        self.hashes = hashes
+        self.audit = audit if audit < stable else 0
+        self.hash = self._hash()
+
+    @classmethod
+    def whole(cls, values):
+        header, rows = values[:LIVE_HEADER], values[LIVE_HEADER:]
+        changing = _changing(rows)
+        digest = hashlib.sha256(json.dumps(header).encode())
+        hashes = _extend(digest, rows[changing:])
+        return cls(header, changing, rows[:changing + LIVE_OVERLAP], len(rows) - changing, digest, time.time(), hashes)
+
+    def _hash(self):
+        digest = self.digest.copy()
+        _extend(digest, self.top[:self.changing])
+        return digest.hexdigest()
+
+    def expired(self):
+        return time.time() - self.read > LIVE_FULL_SECONDS
+
+    def _widths(self):
+        # The number of columns read from each block of columns (see LIVE_COLUMNS)
+        first, end, rest = LIVE_COLUMNS
+        width = len(self.header[-1]) if len(self.header) == LIVE_HEADER else 0
+        return [end - first, width - (end - first)] if width > end - first else [end - first]
+
+    def _audited(self):
+        # The stable rows audited, oldest first, and the rows of the worksheet to read them from
+        # New days push the rows down, so LIVE_NEW_ROWS more rows are read below them
+        audited = range(self.audit, min(self.audit + LIVE_AUDIT_ROWS, self.stable))
+        bottom = LIVE_HEADER + self.changing + self.stable # The row of the oldest day when the sheet was read
+        return audited, bottom - audited.stop + 1, bottom - audited.start + LIVE_NEW_ROWS
+
+    def ranges(self):
+        # The header row, the top rows of the columns read and the rows audited
+        first, end, rest = LIVE_COLUMNS
+        sheet = "'%s'" % WORKSHEETS['live']
+        columns = [(first, end - 1)] + [(rest, rest + width - 1) for width in self._widths()[1:]]
+        blocks = [(LIVE_HEADER + 1, LIVE_HEADER + len(self.top) + LIVE_NEW_ROWS)]
+        audited, above, below = self._audited()
+        if audited:
+            blocks.append((above, below))
+        ranges = ['%s!%d:%d' % (sheet, LIVE_HEADER, LIVE_HEADER)]
+        for above, below in blocks:
+            ranges += ['%s!%s%d:%s%d' % (sheet, _letters(left), above, _letters(right), below) for left, right in columns]
+        return ranges
+
+    def sync(self, value_ranges):
+        # The rows that are new or have changed given the values of self.ranges(),
+        # or None when they can't be lined up with the rows read before
+        first, end, rest = LIVE_COLUMNS
+        width = len(self.header[-1]) if len(self.header) == LIVE_HEADER else 0
+        header = value_ranges[0].get('values', [[]])[0]
+        header = _live_columns([header + [''] * (rest + width - (end - first) - len(header))])[0]
+        if width < end - first or header != self.header[-1]:
+            return None
+
+        widths = self._widths()
+        audited, above, below = self._audited()
+        top = value_ranges[1:1 + len(widths)]
+        rows = _join(top, widths, max(len(vr.get('values', [])) for vr in top))
+
+        overlap = self.top[self.changing:]
+        if not overlap:
+            return None
+        for new in range(LIVE_NEW_ROWS + 1):
+            start = new + self.changing
+            if rows[start:start + len(overlap)] == overlap:
+                break
+        else:
+            return None
+
+        if audited:
+            # The audited rows, pushed down by the new days, must be the same as when they were read
+            rows_audited = _join(value_ranges[1 + len(widths):], widths, below - above + 1)[new:new + len(audited)]
+            if _extend(hashlib.sha256(), rows_audited) != self.hashes[audited.start:audited.stop]:
+                return None
+
+        # The rows that were stable stay so, only the new and changed rows are looked at again
+        top = rows[:start]
+        changing = _changing(top)
+        digest = self.digest.copy()
+        hashes = self.hashes + _extend(digest, top[changing:])
+        history = LiveHistory(self.header, changing, (top + overlap)[:changing + LIVE_OVERLAP],
+                              self.stable + len(top) - changing, digest, self.read, hashes,
+                              audited.stop if audited else 0)
+        return LiveUpdate(history, top, self.stable)
+
+
+class LiveUpdate:
+    # The rows of Prevalence_Live read by a fetch, newest first: either all of them,
+    # or the new and changed ones to be put on top of the bottom `kept` rows of the snapshot being served
+
+    def __init__(self, history, rows, kept = 0):
+        self.history = history
+        self.rows = rows
+        self.kept = kept
+
+    @classmethod
+    def read(cls, values):
+        values = _live_columns(values)
+        return cls(LiveHistory.whole(values), values[LIVE_HEADER:])
+
+
+# --------------------------- Generating DataFrames from the Worksheets --------------------------------
+
+def _table(values):
+    table = pd.DataFrame.from_records(values)
+    table.columns = list(table.iloc[0]) # Reassigning the first row as column names
+    table = table.drop(0)
+    table.reset_index(drop=True, inplace=True)
+    return table
+
+
+def _live(values):
+    # Only the columns of active case number and growth rate are read (see _live_columns)
+    # The first row is the name of the worksheet and the second one has the column names
+    columns = values[LIVE_HEADER - 1]
+    return pd.DataFrame(np.array(values[LIVE_HEADER:], dtype = object).reshape(-1, len(columns)), columns = columns)
+
+
+def _responses(values):
+    # Only the respondent and their ID string are kept from the form responses
+    # They are only used to find the answers of a respondent (see profile), so without the worksheet or one of
+    # these columns there are no respondents and every page starts with the latest form response instead
+    responses = _table(values) if values else pd.DataFrame()
+    missing = [column for column in (RESPONDENT_COLUMN, ID_COLUMN) if column not in responses.columns]
+    if missing:
+        if values:
+            log.warning("Worksheet '%s' has no column '%s', no respondent can be looked up",
+                        WORKSHEETS['responses'], "', '".join(missing))
+        return pd.DataFrame({RESPONDENT_COLUMN: pd.Series(dtype = object), ID_COLUMN: pd.Series(dtype = object)})
+    return responses[[RESPONDENT_COLUMN, ID_COLUMN]]
+
+
+# The builder of each DataFrame and the number of rows above the data in its worksheet
+BUILDERS = {
+    'p_inf': (_table, 1),
+    'p_adv': (_table, 1),
+    'healthsys': (_table, 1),
+    'prev': (_table, 1),
+    'live': (_live, LIVE_HEADER),
+    'transmission': (_table, 1),
+    'responses': (_responses, 1)
+}
+
+# The type of each column, applied once when the DataFrame is built so that callbacks never have to convert values
+# Codes are small integers, probabilities and counts are floats and text that repeats is categorical
+# A '?' means the column may have missing values, otherwise rows with a missing value are dropped
+# Columns that are not listed are kept as text, 'text' and 'id' columns are checked against the patterns below
+SCHEMAS = {
+    'p_inf': {'Gender': 'int8', 'City_code': 'int16', 'Prob': 'float64'},
+    'p_adv': {'Age': 'int8', 'Diabetes': 'int8', 'Hypertension': 'int8', 'Hosp': 'float64', 'Death': 'float64'},
+    'healthsys': {'City_code': 'int16', 'Beds': 'float64', 'ICU': 'float64'},
+    'prev': {'City_code': 'int16'},
+    'live': {'active_*': 'float64?', 'growth_*': 'float64?'},
+    'transmission': {'City_code': 'int16', 'Place': 'category', 'Type': 'category', 'Transmission': 'float64'},
+    'responses': {RESPONDENT_COLUMN: 'text', ID_COLUMN: 'id'}
+}
+MISSING = ['NA', '#N/A', ''] # Cells the sheet uses for values that are not known (yet)
+PATTERNS = {'text': r'.*\S.*', 'id': r'\d{5}'} # Any text that isn't blank and the 5 digit ID strings
+
+
+def _column_type(name, column):
+    for pattern, dtype in SCHEMAS[name].items():
+        if fnmatch.fnmatchcase(column, pattern):
+            return dtype
+    return None
+
+
+def _typed(name, frame, offset, problems):
+    # Convert the columns of the DataFrame to the types in its schema
+    # Values that can't be converted are reported in problems along with their row in the worksheet
+    dropped = pd.Series(False, index = frame.index)
+    integers = {}
+    numeric = {} # The numeric columns of each type
+
+    for column in SCHEMAS[name]:
+        if '*' not in column and column not in frame.columns:
+            raise ValueError("Worksheet '%s' has no column '%s'" % (WORKSHEETS[name], column))
+
+    for column in frame.columns:
+        dtype = _column_type(name, column)
+        if dtype is None:
+            continue
+        if dtype == 'category':
+            frame[column] = frame[column].astype('category')
+            continue
+        if dtype in PATTERNS:
+            text = frame[column]
+            valid = text.str.fullmatch(PATTERNS[dtype])
+            for row in frame.index[~valid]:
+                problems.append("%s row %d: '%s' is not a valid %s" % (WORKSHEETS[name], row + offset + 1, text[row], column))
+            dropped |= ~valid
+            continue
+
+        numeric.setdefault(dtype, []).append(column)
+
+    # The numeric columns of the same type are converted together,
+    # which is much quicker for worksheets with many columns such as Prevalence_Live
+    for dtype, columns in numeric.items():
+        nullable = dtype.endswith('?')
+        dtype = dtype.rstrip('?')
+        text = frame[columns].to_numpy(dtype = object)
+        missing = pd.DataFrame(text).isin(MISSING).to_numpy()
+        values = pd.to_numeric(pd.Series(text.ravel()).where(~missing.ravel()), errors = 'coerce')
+        values = values.to_numpy(dtype = float).reshape(text.shape)
+        if dtype.startswith('int'):
+            # Codes index the arrays built from the sheets (see indicators.py and risk.py), so only whole numbers
+            # from 0 to the largest the type holds are valid, eg. '1.5', '-1' and '40000' are not City_codes
+            values[(values != np.floor(values)) | (values < 0) | (values > np.iinfo(dtype).max)] = np.nan
+
+        malformed = np.isnan(values) & ~missing
+        for column, row in zip(*np.nonzero(malformed.T)):
+            problems.append("%s row %d: '%s' is not a valid %s" % (WORKSHEETS[name], row + offset + 1, text[row, column], columns[column]))
+        if not nullable:
+            for column, row in zip(*np.nonzero(missing.T)):
+                problems.append('%s row %d: %s is missing' % (WORKSHEETS[name], row + offset + 1, columns[column]))
+            dropped |= np.isnan(values).any(axis = 1)
+
+        if dtype.startswith('int'):
+            integers.update(dict.fromkeys(columns, dtype))
+        else:
+            values = values.astype(dtype)
+        # Put back as one block rather than column by column
+        converted = pd.DataFrame(values, columns = columns, index = frame.index)
+        frame = pd.concat([frame.drop(columns = columns), converted], axis = 1)[list(frame.columns)]
+
+    if dropped.any():
+        frame = frame[~dropped]
+    if integers:
+        frame = frame.astype(integers)
+    frame.reset_index(drop=True, inplace=True)
+    return frame
+
+
+def _frame(name, values, problems, old = None):
+    builder, offset = BUILDERS[name]
+    if isinstance(values, LiveUpdate):
+        # Only the rows read are converted, the rows below them are kept from the DataFrame of the earlier snapshot
+        frame = _typed(name, builder(values.history.header + values.rows), offset, problems)
+        if values.kept:
+            frame = pd.concat([frame, old.iloc[len(old) - values.kept:]], ignore_index = True)
+        return frame
+    return _typed(name, builder(values), offset, problems)
+
+
+def _report(problems):
+    for problem in problems:
+        log.warning('Skipped malformed data: %s', problem)
+
+
+class Snapshot:
+    # One consistent version of the spreadsheet: a DataFrame for each worksheet and the latest ID string
+    # Callbacks should get the snapshot once and read everything they need from it
+
+    def __init__(self, frames, latest, hashes, problems = None, history = None):
+        self.frames = frames
+        self.latest = latest
+        self.hashes = hashes # The hash of the values each DataFrame was built from
+        self.problems = problems or {} # The malformed data found in each worksheet when it was loaded
+        self.history = history # The rows of Prevalence_Live read for this snapshot, None when it was restored from disk
+        self.version = hashlib.sha256(json.dumps([latest, hashes], sort_keys = True).encode()).hexdigest()[:16]
+        self._derived = {}
+
+    def __getitem__(self, name):
+        return self.frames[name]
+
+    def get(self, compute):
+        # The value of compute(snapshot), computed only once for each snapshot
+        if compute not in self._derived:
+            self._derived[compute] = compute(self)
+        return self._derived[compute]
+
+
+def derived(compute):
+    # Register a function that computes something from the data, such as a lookup table
+    # It is computed for every new snapshot before that snapshot is served, so it never runs inside a callback
+    # Read its value with data.current().get(compute)
+    _derivations.append(compute)
+    return compute
+
+
+def build(values, latest):
+    problems = {name: [] for name in values}
+    frames = {name: _frame(name, values[name], problems[name]) for name in values}
+    hashes = {name: _digest(values[name]) for name in values}
+    _report(sum(problems.values(), []))
+    return Snapshot(frames, latest, hashes, problems, values['live'].history if 'live' in values else None)
+
+
+def update(snapshot, values, latest):
+    # A new snapshot where only the worksheets that changed are rebuilt
+    # The DataFrames of the other worksheets are shared with the old snapshot
+    frames = dict(snapshot.frames)
+    hashes = dict(snapshot.hashes)
+    problems = dict(snapshot.problems)
+    history = snapshot.history
+    for name in changed(values, snapshot):
+        problems[name] = []
+        frames[name] = _frame(name, values[name], problems[name], snapshot.frames.get(name))
+        hashes[name] = _digest(values[name])
+        _report(problems[name])
+        if name == 'live':
+            history = values[name].history
+    return Snapshot(frames, latest, hashes, problems, history)
+
+
+# --------------------------- Saving the Data Locally --------------------------------
+
+# Each DataFrame is written as an uncompressed Arrow file and memory-mapped when it is read back
+# The numeric columns are used straight from the mapping, without a copy: every process that restores the same
+# snapshot (see reload) shares their memory through the page cache, and they are read-only
+# Text and categorical columns are still copied into each process when they are read, and so are the tables
+# derived from the data (see derived), which each process computes for itself
+# A manifest records the format version and the hashes of the values and of the files
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _arrow(frame):
+    # Missing numbers are written as NaN values rather than as Arrow nulls,
+    # which would have to be filled in with NaN in a copy of the column when it is read
+    table = pa.Table.from_pandas(frame, preserve_index = False)
+    for i, column in enumerate(frame.columns):
+        if frame[column].dtype.kind == 'f':
+            table = table.set_column(i, table.field(i), pa.array(frame[column].to_numpy(), from_pandas = False))
+    return table
+
+
+def save(snapshot):
+    os.makedirs(SNAPSHOT_DIR, exist_ok = True)
+    files = {}
+    for name, frame in snapshot.frames.items():
+        # Name the files after their contents so that a snapshot being read is never overwritten
+        filename = '%s-%s.arrow' % (name, snapshot.hashes[name][:16])
+        path = os.path.join(SNAPSHOT_DIR, filename)
+        if not os.path.exists(path):
+            tmp = '%s.%d.tmp' % (path, os.getpid())
+            feather.write_feather(_arrow(frame), tmp, compression = 'uncompressed')
+            os.replace(tmp, path)
+        files[name] = {'file': filename, 'sha256': _file_hash(path)}
+
+    manifest = {
+        'format': FORMAT_VERSION,
+        'sheet': SHEET_KEY,
+        'latest': snapshot.latest,
+        'hashes': snapshot.hashes,
+        'files': files
+    }
+    path = os.path.join(SNAPSHOT_DIR, 'manifest.json')
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent = 1)
+    os.replace(tmp, path) # The new snapshot only becomes visible once it is complete
+
+    # Remove the files that are no longer part of the snapshot
+    keep = {entry['file'] for entry in files.values()} | {'manifest.json'}
+    for filename in os.listdir(SNAPSHOT_DIR):
+        if filename not in keep and not filename.endswith('.tmp'):
+            os.remove(os.path.join(SNAPSHOT_DIR, filename))
+
+
+def restore():
+    # Returns the snapshot saved on disk, or None if there is none that can be used
+    try:
+        manifest = _read_manifest()
+        if manifest['format'] != FORMAT_VERSION or manifest['sheet'] != SHEET_KEY:
+            return None
+        if set(manifest['files']) != set(WORKSHEETS):
+            return None
+
+        frames = {}
+        for name, entry in manifest['files'].items():
+            path = os.path.join(SNAPSHOT_DIR, entry['file'])
+            if _file_hash(path) != entry['sha256']:
+                log.warning('Snapshot file %s is corrupt, ignoring the snapshot', path)
+                return None
+            # One block for each column, or pandas would copy the columns of each type into one array
+            frames[name] = feather.read_table(path, memory_map = True).to_pandas(split_blocks = True)
+    except (OSError, ValueError, KeyError) as e:
+        log.info('No usable snapshot in %s: %s', SNAPSHOT_DIR, e)
+        return None
+
+    return Snapshot(frames, manifest['latest'], manifest['hashes'])
+
+
+def _persist(snapshot):
+    try:
+        save(snapshot)
+    except Exception:
+        log.exception('Could not save the snapshot to %s', SNAPSHOT_DIR)
+
+
+# --------------------------- Serving the Data --------------------------------
+
+def subscribe(listener):
+    # Call listener(old, new) whenever a new snapshot replaces the one being served
+    _listeners.append(listener)
+    return listener
+
+
+def publish(snapshot):
+    global _snapshot
+    for compute in _derivations:
+        snapshot.get(compute)
+    old, _snapshot = _snapshot, snapshot
+    if old is not None:
+        for listener in _listeners:
+            try:
+                listener(old, snapshot)
+            except Exception:
+                log.exception('Listener %s failed', listener)
+
+
+def load():
+    # Fetch the whole sheet and serve it
+    snapshot = build(*fetch())
+    publish(snapshot)
+    _persist(snapshot)
+    return snapshot
+
+
+def refresh(names = tuple(WORKSHEETS)):
+    # Fetch the given worksheets again and replace the snapshot being served if anything has changed
+    # The new snapshot is built off to the side and swapped in at once,
+    # so callbacks keep reading the previous one until it is ready
+    with _update_lock:
+        try:
+            values, latest = _fetch_with_retry(names, _snapshot)
+        except Exception:
+            log.exception('Could not reach the sheet, still serving the data from %s', _snapshot.version)
+            return False
+        if 'live' in values and values['live'].history.hash == _snapshot.hashes.get('live'):
+            # Nothing has changed, but the next refresh can start from the rows read this time
+            _snapshot.history = values['live'].history
+        if not changed(values, _snapshot) and latest == _snapshot.latest:
+            return False
+        try:
+            snapshot = update(_snapshot, values, latest)
+            publish(snapshot)
+        except Exception:
+            log.exception('Could not build the new data, still serving the data from %s', _snapshot.version)
+            return False
+    _persist(snapshot)
+    log.info('Now serving data version %s', snapshot.version)
+    return True
+
+
+def reconcile():
+    # Compare the snapshot restored from disk with the live sheet
+    refresh()
+
+
+def _refresh_periodically(stop, interval, names):
+    current()
+    while not stop.wait(interval):
+        refresh(names)
+
+
+def start_refresher(interval = REFRESH_SECONDS, names = REFRESHED):
+    # Keep the worksheets that change during the day up to date in a background thread
+    # Returns an event that stops the thread when set
+    stop = threading.Event()
+    if interval > 0:
+        threading.Thread(target = _refresh_periodically, args = (stop, interval, names),
+                         name = 'refresher', daemon = True).start()
+    return stop
+
+
+def _read_manifest():
+    with open(os.path.join(SNAPSHOT_DIR, 'manifest.json')) as f:
+        return json.load(f)
+
+
+def reload():
+    # Serve the snapshot saved on disk if it is newer than the one being served
+    try:
+        manifest = _read_manifest()
+    except (OSError, ValueError):
+        return False
+    if manifest.get('hashes') == _snapshot.hashes and manifest.get('latest') == _snapshot.latest:
+        return False
+    with _update_lock:
+        snapshot = restore()
+        if snapshot is None:
+            return False # It may be in the middle of being replaced, try again next time
+        publish(snapshot)
+    log.info('Now serving data version %s', snapshot.version)
+    return True
+
+
+def _reload_periodically(stop, interval):
+    while not stop.wait(interval):
+        reload()
+
+
+def watch(interval = WATCH_SECONDS):
+    # For processes that never fetch the sheet themselves, such as the workers of a server:
+    # keep serving the latest snapshot saved on disk by the one process that does
+    # Returns an event that stops the thread when set
+    stop = threading.Event()
+    threading.Thread(target = _reload_periodically, args = (stop, interval), name = 'watcher', daemon = True).start()
+    return stop
+
+
+def start():
+    # Serve the snapshot saved on disk straight away when there is one and check the live sheet afterwards
+    # Otherwise wait for the sheet to be fetched
+    snapshot = restore()
+    if snapshot is None:
+        load()
+    else:
+        publish(snapshot)
+        threading.Thread(target = reconcile, name = 'reconcile', daemon = True).start()
+
+
+def preload():
+    # Start loading the data in a background thread, so that it is usually ready by the time a page needs it
+    # without holding up anything that doesn't need it, such as the layout of the app
+    threading.Thread(target = current, name = 'preload', daemon = True).start()
+
+
+def current():
+    # The data is only loaded the first time some page needs it
+    if _snapshot is None:
+        with _lock:
+            if _snapshot is None:
+                start()
+    return _snapshot
+
+
+# Based on inputs from the user, an ID string is generated for each user.
+# The input parameters are gender, city, age and whether they have diabetes and hypertension
+# Each parameter value is coded with a digit
+# eg: 1 for female and 2 for male
+# eg ID string: 11100
+def decode(string):
+    gender, city, age, diabetes, hyper = [int(code) for code in string] # Break the ID string to get the single digit codes for each parameter
+    return gender, city, age, diabetes, hyper
+
+
+# --------------------------- Looking up Respondents --------------------------------
+
+# The ID string of every respondent is kept in a dictionary so that it can be found without reading the sheet
+# Form responses are only ever appended, so when the sheet is refreshed only the new rows are added to it
+
+_respondents = (None, {}) # The form responses the index was last built from and the index
+
+
+@derived
+def respondents(snapshot):
+    global _respondents
+    responses = snapshot['responses']
+    previous, index = _respondents
+
+    start = 0
+    if previous is not None and 0 < len(previous) <= len(responses) \
+            and responses.iloc[len(previous) - 1].equals(previous.iloc[-1]):
+        start = len(previous) # The old responses are still there, only add the new ones
+    else:
+        index = {}
+
+    # Later responses of the same respondent replace their earlier ones
+    # The dictionary is shared with the earlier snapshots, which can only gain respondents this way
+    index.update(zip(responses[RESPONDENT_COLUMN].iloc[start:], responses[ID_COLUMN].iloc[start:]))
+    _respondents = (responses, index)
+    return index
+
+
+def profile(respondent = None):
+    # The codes used as the default values of the dropdowns:
+    # those of the respondent when they are known, otherwise those of the latest form response
+    snapshot = current()
+    string = snapshot.get(respondents).get(respondent, snapshot.latest)
+    return decode(string)
@@ -0,0 +1,38 @@
+import dash_core_components as dcc
+from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
+
+from app import app
+import data
+from cities import city_catalogue
+
+# --------------------------- The City Dropdown --------------------------------
+
+# Every page has the same dropdown for selecting the city, with the id 'city'
+# It starts with the first few cities and the one selected, as there may be thousands of them
+# The cities matching what the user types are looked up on the server (see cities.py)
+
+
+def city_dropdown(city):
+    catalogue = data.current().get(city_catalogue)
+    return dcc.Dropdown(id = 'city', options = _with_selected(catalogue.search(), catalogue, city),
+        value = city, # By dafault, it displays the value chosen by the user when filling the form
+        persistence = True, persistence_type = 'memory', # So that the value selected by the user is retained even when the page is changed
+        placeholder = 'Select your City',
+        clearable = False # Every page needs a city, so the selected one can only be replaced by another
+        )
+
+
+def _with_selected(options, catalogue, city):
+    # The selected city must stay in the options, or the dropdown would show it as empty
+    if city is not None and all(option['value'] != city for option in options):
+        options = options + [catalogue.option(city)]
+    return options
+
+
+@app.callback(Output('city', 'options'), Input('city', 'search_value'), State('city', 'value'))
+def city_options(search, city):
+    if search is None:
+        raise PreventUpdate
+    catalogue = data.current().get(city_catalogue)
+    return _with_selected(catalogue.search(search), catalogue, city)
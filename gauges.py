@@ -0,0 +1,67 @@
+from functools import lru_cache
+
+import plotly.graph_objects as go
+from dash import Patch
+
+# --------------------------- Linear Gauges --------------------------------
+
+# Every page displays its indicators as linear (bullet) gauges that only differ in their colours,
+# upper limit, title and the value of the pointer. Building and validating a plotly figure is much slower
+# than the rest of a callback, so each gauge is built only once and handed out as a plain figure dict
+# The figures returned are shared between callbacks and must not be modified
+#
+# The gauges are put on the page with the layout, so when an input changes a callback only has to send
+# the new value of the pointer (see pointer) instead of the whole figure
+
+REDS = ('#fbc4ab', '#f8ad9d', '#f4978e', '#f08080') # The colour hexcodes for the red linear gauge
+VIOLETS = ('#c77dff', '#9d4edd', '#5a189a', '#240046') # The colour hexcodes for the purple linear gauge
+SHADE = 'rgba(0, 0, 0, 0.3)' # The colour laid over the steps of a gauge to shade an interval, see pointer
+
+
+@lru_cache(maxsize = None)
+def _template(palette, limit, title):
+    fig = go.Figure()
+
+    fig.add_trace(go.Indicator(
+        mode = 'gauge',
+        value = 0,
+        delta = {'reference': limit},
+        domain = {'x': [0, 1], 'y': [0, 1]},
+        title = {'text': title},
+        gauge = {
+            'shape': "bullet",
+            'axis': {'range': [None, limit]},
+            'steps': [
+                # Set the colour for each threshold range
+                {'range': [0, limit/4], 'color': palette[0]},
+                {'range': [limit/4, limit/2], 'color': palette[1]},
+                {'range': [limit/2, limit*3/4], 'color': palette[2]},
+                {'range': [limit*3/4, limit], 'color': palette[3]}],
+            'bar': {'color': '#FFFFFF'}})) # Set the clour of the horizontal pointer bar to white
+
+    fig.update_layout(height = 80, margin = {'t':0, 'b':0, 'l':0})
+
+    return fig.to_plotly_json()
+
+
+@lru_cache(maxsize = 4096)
+def gauge(palette, limit, value, title):
+    # The figure of a linear gauge with the pointer set to value
+    # Only the trace holding the value is copied, everything else is shared with the template
+    template = _template(palette, float(limit), title)
+    trace = dict(template['data'][0], value = float(value))
+    return {'data': [trace], 'layout': template['layout']}
+
+
+def pointer(value, interval = None):
+    # A partial update of a gauge already on the page which only moves its pointer to value
+    # A few dozen bytes are sent to the browser instead of the whole figure
+    # Given an interval (low, high) it is shaded by a fifth step laid over the coloured ones, and the pointer is made
+    # thinner so that the shade shows on both sides of it. An empty interval, eg. (value, value), removes the shade
+    patch = Patch()
+    patch['data'][0]['value'] = float(value)
+    if interval is not None:
+        low, high = float(interval[0]), float(interval[1])
+        patch['data'][0]['gauge']['steps'][4] = {'range': [low, high], 'color': SHADE}
+        patch['data'][0]['gauge']['bar']['thickness'] = 0.4 if high > low else 1
+    return patch
@@ -1,13 +1,20 @@
+from functools import lru_cache
+from urllib.parse import parse_qs
+
 import dash_core_components as dcc
 import dash_html_components as html
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
 
 # Connect to main app.py file
 from app import app
 from app import server
+import data
+import metrics
 
 # Connect to your app pages
-from pages import riskProfile, healthSystem, prevalence, transmission, overall
+# The pages are imported up front so that their callbacks are registered before the browser asks for them
+# Importing them doesn't read the sheet, the data is only loaded through data.py
+from pages import riskProfile, healthSystem, prevalence, transmission, overall, trends
 #from pages import riskProfile, healthSystem, prevalence
 
 import pip
@@ -23,31 +30,49 @@ def install(package):
 # define the app layout
 app.layout = html.Div([
     dcc.Location(id='url', refresh=False),
+    dcc.Store(id='respondent', storage_type='session'), # The respondent ID given in the URL, eg. /pages/riskProfile?id=...
     html.Div([
         dcc.Link('Risk Profile |', href='/pages/riskProfile'),
         dcc.Link(' Health System |', href='/pages/healthSystem'),
         dcc.Link(' Prevalence |', href='/pages/prevalence'),
         dcc.Link(' Transmission |', href='/pages/transmission'),
+        dcc.Link(' Trends |', href='/pages/trends'),
         dcc.Link(' Overall', href='/pages/overall')
     ], className="row"),
     html.Div(id='page-content', children=[])
 ])
 
-@app.callback(Output('page-content', 'children'),
-              [Input('url', 'pathname')])
-def display_page(pathname):
-    if pathname == '/pages/riskProfile':
-        return riskProfile.layout
-    if pathname == '/pages/healthSystem':
-        return healthSystem.layout
-    if pathname == '/pages/prevalence':
-        return prevalence.layout
-    if pathname == '/pages/transmission':
-        return transmission.layout
-    if pathname == '/pages/overall':
-        return overall.layout
-    else:
-        return riskProfile.layout
+# Each route and the function building the layout of its page
+PAGES = {
+    '/pages/riskProfile': riskProfile.layout,
+    '/pages/healthSystem': healthSystem.layout,
+    '/pages/prevalence': prevalence.layout,
+    '/pages/transmission': transmission.layout,
+    '/pages/overall': overall.layout,
+    '/pages/trends': trends.layout
+}
+DEFAULT_PAGE = '/pages/riskProfile' # Shown for any other route
+
+
+@lru_cache(maxsize = 1024)
+def page(pathname, profile, version):
+    # A page is only built the first time its route is visited with a profile, later visits get the same layout
+    # The layouts hold some of the data, such as the names of the cities, so they are built again for each version
+    return PAGES.get(pathname, PAGES[DEFAULT_PAGE])(profile)
+
+
+@app.callback([Output('page-content', 'children'), Output('respondent', 'data')],
+              [Input('url', 'pathname')],
+              [State('url', 'search'), State('respondent', 'data')])
+def display_page(pathname, search, respondent):
+    # The pages are built for each respondent, with the dropdowns set to the answers they gave in the form
+    # The respondent is remembered for the session, as the links between the pages don't keep the ID in the URL
+    respondent = parse_qs((search or '').lstrip('?')).get('id', [respondent])[0]
+    profile = data.profile(respondent)
+    return page(pathname, profile, data.current().version), respondent
+
+# Time every callback when METRICS=1 (see metrics.py)
+metrics.install(app)
 
 if __name__ == '__main__':
     # install all the packages
@@ -56,6 +81,12 @@ if __name__ == '__main__':
     install('dash')
     install('gspread')
     install('plotly')
+    install('pyarrow')
+
+    # load the data in the background, the app starts serving straight away
+    # and keep the live data up to date while the app is running
+    data.preload()
+    data.start_refresher()
 
     # run the app
     app.run_server(debug=True)
@@ -0,0 +1,158 @@
+import numpy as np
+import pandas as pd
+
+import data
+from levels import classify
+
+# --------------------------- Values of the City Indicators --------------------------------
+
+# The value of the bar chosen by the user on the transmission bar graph is used as the transmisson risk
+# for caluculating overall risk. Until then it is the mean of the values of the places of the city,
+# and DEFAULT_TRANSMISSION for a city without any places in the sheet 'Transmission'
+DEFAULT_TRANSMISSION = 10
+
+
+@data.derived
+def latest_values(snapshot):
+    # The number of active cases and the growth rate on the latest day they are known for, keyed by the city code
+    # The live data is not always up to date and some of the latest values might be missing,
+    # so for each column take the value of the first cell that isn't missing
+    # Only the columns of active cases and growth rates, the other columns of the worksheet may hold text
+    live = snapshot['live']
+    cities = [column[len('active_'):] for column in live.columns
+              if column.startswith('active_') and 'growth_' + column[len('active_'):] in live.columns]
+    active = live[['active_' + city for city in cities]].to_numpy(dtype = float)
+    growth = live[['growth_' + city for city in cities]].to_numpy(dtype = float)
+    if not len(live):
+        return {}
+    columns = np.arange(len(cities))
+    first_active, first_growth = (~np.isnan(active)).argmax(axis = 0), (~np.isnan(growth)).argmax(axis = 0)
+    active, growth = active[first_active, columns], growth[first_growth, columns]
+
+    latest = {}
+    for city, cases, rate in zip(cities, active, growth):
+        if not (np.isnan(cases) or np.isnan(rate)):
+            latest[int(city)] = (float(cases), float(rate))
+    return latest
+
+
+# --------------------------- Indicators of Every City --------------------------------
+
+# Every indicator of every city is computed in one go whenever the data is loaded or refreshed,
+# so every page, the Overall Risk page included, reads the same values and none of them is computed twice
+# Each is a read-only array indexed by the city code. Cities that are not in the sheets are NaN, and so are
+# the levels that aren't known because a value is missing (level 0 in levels.py)
+#   beds, icu: percentage of hospital beds and ICU beds occupied, and their levels beds_level, icu_level
+#   health: the Health System Response level they combine into
+#   active, growth: the latest number of active cases and growth rate, and their levels active_level, growth_level
+#   prevalence: the prevalence level they combine into
+#   transmission: the transmission risk used until the user picks a place on the Transmission page (see above)
+# and the normalised values that are added up into the overall risk
+#   health_score, prevalence_score, transmission_score
+
+SCORES = {'health': 4, 'prevalence': 4, 'transmission': 100} # The upper limit each indicator is normalised by
+NO_DATA = 'There is no data for this city' # Shown instead of the level of an indicator that isn't known
+
+
+class CityIndicators:
+
+    def __init__(self, **arrays):
+        for name, values in arrays.items():
+            values.setflags(write = False) # Shared by every request, so they must never be changed
+            setattr(self, name, values)
+
+    def value(self, name, city):
+        # The value of one indicator of one city, None when it isn't known
+        values = getattr(self, name)
+        known = 0 <= city < len(values) and not np.isnan(values[city])
+        return float(values[city]) if known else None
+
+    def level(self, name, city):
+        # The level of one indicator of one city, 0 when it isn't known as in levels.py
+        value = self.value(name, city)
+        return 0 if value is None else int(value)
+
+    def scores(self, city):
+        # The normalised values of one city, None for the ones that aren't known
+        return {name: self.value(name + '_score', city) for name in SCORES}
+
+
+@data.derived
+def city_indicators(snapshot):
+    healthsys = snapshot['healthsys']
+    latest = snapshot.get(latest_values)
+
+    codes = healthsys['City_code'].to_numpy()
+    places = snapshot['transmission']['City_code'].to_numpy()
+    size = max(codes.max(), places.max(initial = 0), max(latest, default = 0)) + 1
+    values = {name: np.full(size, np.nan) for name in
+              ['beds', 'icu', 'beds_level', 'icu_level', 'health',
+               'active', 'growth', 'active_level', 'growth_level', 'prevalence', 'transmission']}
+
+    # The levels of every city are found at once (see levels.py)
+    values['beds'][codes] = healthsys['Beds']
+    values['icu'][codes] = healthsys['ICU']
+    levels = classify('health', beds = values['beds'][codes], icu = values['icu'][codes])
+    values['beds_level'][codes], values['icu_level'][codes], values['health'][codes] = \
+        levels['beds'], levels['icu'], levels['health']
+
+    cities = np.array(list(latest), dtype = int)
+    if len(cities):
+        values['active'][cities], values['growth'][cities] = np.array(list(latest.values())).T
+        levels = classify('prevalence', active = values['active'][cities], growth = values['growth'][cities])
+        values['active_level'][cities], values['growth_level'][cities], values['prevalence'][cities] = \
+            levels['active'], levels['growth'], levels['prevalence']
+
+    # The mean transmission value of the places of each city, summed up for every city at once
+    values['transmission'][codes] = DEFAULT_TRANSMISSION
+    transmission = snapshot['transmission']['Transmission'].to_numpy(dtype = float)
+    known = ~np.isnan(transmission)
+    counts = np.bincount(places[known], minlength = size)
+    sums = np.bincount(places[known], weights = transmission[known], minlength = size)
+    values['transmission'][counts > 0] = sums[counts > 0] / counts[counts > 0]
+
+    for name in ['beds_level', 'icu_level', 'health', 'active_level', 'growth_level', 'prevalence']:
+        values[name][values[name] == 0] = np.nan # A level that isn't known
+
+    for name, limit in SCORES.items():
+        values[name + '_score'] = values[name] / limit
+    return CityIndicators(**values)
+
+
+@data.derived
+def prevalence_history(snapshot):
+    # The levels of active cases, growth rate and prevalence of every city on every day of Prevalence_Live
+    # Each is a DataFrame with a row for each day and a column for each city code, level 0 where the value is missing
+    live = snapshot['live']
+    cities = [column[len('active_'):] for column in live.columns if column.startswith('active_')]
+    active = live[['active_' + city for city in cities]].to_numpy(dtype = float)
+    growth = live[['growth_' + city for city in cities]].to_numpy(dtype = float)
+
+    levels = classify('prevalence', active = active, growth = growth)
+    columns = [int(city) for city in cities]
+    return {name: pd.DataFrame(levels[name], index = live.index, columns = columns) for name in levels}
+
+
+# --------------------------- Places of Every City --------------------------------
+
+class PlaceGroups:
+    # The places in the sheet 'Transmission' grouped by city and type, ready to be drawn as bars
+    # types: every type in the order it first appears in the sheet, which gives each type the same colour in every city
+    # groups: {city code: [(type, names of the places, their transmission values)]}
+
+    def __init__(self, types, groups):
+        self.types = types
+        self.groups = groups
+
+
+@data.derived
+def place_groups(snapshot):
+    transmission = snapshot['transmission']
+    places = transmission['Place'].astype(str).to_numpy()
+    values = transmission['Transmission'].to_numpy()
+
+    groups = {}
+    indices = transmission.groupby(['City_code', 'Type'], sort = False, observed = True).indices
+    for (city, kind), rows in sorted(indices.items(), key = lambda item: item[1][0]): # In the order of the sheet
+        groups.setdefault(int(city), []).append((str(kind), places[rows].tolist(), values[rows].tolist()))
+    return PlaceGroups([str(kind) for kind in transmission['Type'].unique()], groups)
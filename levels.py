@@ -0,0 +1,59 @@
+import numpy as np
+
+# --------------------------- Levels of the Indicators --------------------------------
+
+# Each indicator is put in one of four levels: 1 (very low), 2 (low), 3 (high) and 4 (very high)
+# A value is at level 1 plus the number of thresholds it is greater than or equal to
+# Missing values are at level 0
+# The levels work on whole arrays at once, eg. every city on every day, as well as on single values
+
+THRESHOLDS = {
+    # Percentage of hospital beds and ICU beds occupied
+    # < 25, between 25 and 50, between 50 and 75, > 75
+    'beds': [25, 50, 75],
+    'icu': [25, 50, 75],
+    # Number of active cases
+    # < 500, between 500 and 1000, between 1000 and 1500, > 1500
+    'active': [500, 1000, 1500],
+    # Growth rate of new cases
+    # negative, between 0 and 1, between 1 and 5, > 5
+    'growth': [0, 1, 5]
+}
+
+# The level of an indicator combined from the levels of two sub-indicators:
+# the name of the sub-indicator giving the row, the one giving the column and the lookup table
+# These tables were based on the values given in the sheet 'Estimates' in 'Indicators estimation.xlsx'
+COMBINATIONS = {
+    'health': ('icu', 'beds', [[1,2,2,3],[2,2,3,3],[2,3,3,4],[3,3,4,4]]),
+    'prevalence': ('active', 'growth', [[1,2,2,3],[2,2,3,3],[2,3,3,4],[3,3,4,4]])
+}
+
+
+def level(name, values):
+    values = np.asarray(values, dtype = float)
+    levels = np.searchsorted(THRESHOLDS[name], values, side = 'right') + 1
+    return np.where(np.isnan(values), 0, levels)[()] # [()] gives back a single number for a single value
+
+
+def _padded(lookup):
+    # Add a row and a column of zeros for level 0, so that a missing sub-indicator gives a missing indicator
+    lookup = np.asarray(lookup)
+    padded = np.zeros((lookup.shape[0] + 1, lookup.shape[1] + 1), dtype = lookup.dtype)
+    padded[1:, 1:] = lookup
+    return padded
+
+
+_LOOKUPS = {name: _padded(lookup) for name, (rows, columns, lookup) in COMBINATIONS.items()}
+
+
+def combine(name, row_levels, column_levels):
+    return _LOOKUPS[name][row_levels, column_levels]
+
+
+def classify(name, **values):
+    # The levels of both sub-indicators and of the indicator they combine into
+    # eg. classify('health', icu = 80, beds = 37) gives {'icu': 4, 'beds': 2, 'health': 3}
+    rows, columns, lookup = COMBINATIONS[name]
+    levels = {rows: level(rows, values[rows]), columns: level(columns, values[columns])}
+    levels[name] = combine(name, levels[rows], levels[columns])
+    return levels
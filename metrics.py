@@ -0,0 +1,171 @@
+import bisect
+import functools
+import logging
+import os
+import threading
+import time
+
+import dash._callback
+from dash.exceptions import PreventUpdate
+from flask import Response
+
+import cache
+import data
+
+log = logging.getLogger(__name__)
+
+# --------------------------- Measuring Where the Time Goes --------------------------------
+
+# When METRICS=1 every server-side callback and every step of loading the data is timed,
+# and the results are served in the Prometheus text format at /metrics
+# For each callback: a histogram of its duration (including turning its outputs into JSON),
+# the number of calls and errors, and a histogram of the size of the response sent to the browser
+# For loading the data: a histogram of the duration of each step
+#   fetch: getting the values from the Sheets API
+#   build: generating the DataFrames from the values
+#   publish: computing the tables derived from the data (see data.derived)
+#   serialize: turning the outputs of callbacks into JSON
+# Callbacks slower than SLOW_CALLBACK_SECONDS are logged along with their inputs
+#
+# Each process keeps its own measurements, so with several workers (see serve.py) each scrape shows one of them
+# Recording a measurement only takes a few microseconds, much less than the quickest callback
+
+ENABLED = os.environ.get('METRICS', '0') not in ('', '0')
+SLOW_CALLBACK_SECONDS = float(os.environ.get('SLOW_CALLBACK_SECONDS', 0.5))
+
+SECONDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BYTES = (1000, 10000, 100000, 1000000, 10000000)
+
+# The data.py functions timed as each step of loading the data
+STEPS = {'fetch': 'fetch', 'build': '_frame', 'publish': 'publish'}
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # The last one counts the values above every bucket
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def lines(self, name, labels):
+        # The lines of this histogram in the Prometheus text format, the counts of the buckets are cumulative
+        with self.lock:
+            counts, total = list(self.counts), self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(list(self.buckets) + ['+Inf'], counts):
+            cumulative += count
+            lines.append('%s_bucket{%sle="%s"} %d' % (name, labels, bound, cumulative))
+        lines.append('%s_sum{%s} %r' % (name, labels.rstrip(','), total))
+        lines.append('%s_count{%s} %d' % (name, labels.rstrip(','), cumulative))
+        return lines
+
+
+class Callback:
+    # The measurements of one callback
+
+    def __init__(self):
+        self.seconds = Histogram(SECONDS)
+        self.bytes = Histogram(BYTES)
+        self.errors = 0
+
+
+_callbacks = {} # Module and name of the callback: Callback
+_steps = {step: Histogram(SECONDS) for step in list(STEPS) + ['serialize']}
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _timed_callback(name, callback):
+    measured = _callbacks[name] = Callback()
+
+    @functools.wraps(callback)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = callback(*args, **kwargs)
+        except PreventUpdate:
+            raise
+        except Exception:
+            measured.errors += 1
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            measured.seconds.observe(seconds)
+            if seconds > SLOW_CALLBACK_SECONDS:
+                log.warning('Slow callback %s took %.3f s with inputs %.500r', name, seconds, args)
+        measured.bytes.observe(len(response))
+        return response
+
+    return wrapper
+
+
+def _timed_step(step, function):
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _steps[step].observe(time.perf_counter() - start)
+
+    return wrapper
+
+
+def exposition():
+    # Every measurement in the Prometheus text format
+    lines = ['# TYPE dash_callback_seconds histogram']
+    for name, measured in _callbacks.items():
+        lines += measured.seconds.lines('dash_callback_seconds', 'callback="%s",' % _label(name))
+    lines.append('# TYPE dash_callback_response_bytes histogram')
+    for name, measured in _callbacks.items():
+        lines += measured.bytes.lines('dash_callback_response_bytes', 'callback="%s",' % _label(name))
+    lines.append('# TYPE dash_callback_errors_total counter')
+    for name, measured in _callbacks.items():
+        lines.append('dash_callback_errors_total{callback="%s"} %d' % (_label(name), measured.errors))
+
+    lines.append('# TYPE data_step_seconds histogram')
+    for step, histogram in _steps.items():
+        lines += histogram.lines('data_step_seconds', 'step="%s",' % step)
+
+    stats = cache.stats()
+    lines.append('# TYPE callback_cache_entries gauge')
+    lines.append('callback_cache_entries %d' % stats['size'])
+    for kind in ('hits', 'misses'):
+        lines.append('# TYPE callback_cache_%s_total counter' % kind)
+        for name, counts in stats['callbacks'].items():
+            lines.append('callback_cache_%s_total{callback="%s"} %d' % (kind, _label(name), counts[kind]))
+
+    snapshot = data._snapshot
+    if snapshot is not None:
+        lines.append('# TYPE data_version_info gauge')
+        lines.append('data_version_info{version="%s"} 1' % snapshot.version)
+    return '\n'.join(lines) + '\n'
+
+
+def install(app):
+    # Time every callback registered so far and serve the measurements at /metrics
+    # Call it after every page has been imported
+    if not ENABLED:
+        return
+    for output, entry in app.callback_map.items():
+        if 'callback' in entry: # Clientside callbacks run in the browser
+            callback = entry['callback']
+            name = '%s.%s' % (callback.__module__, callback.__name__) # Named the same way as in cache.py
+            entry['callback'] = _timed_callback(name, callback)
+    for step, function in STEPS.items():
+        setattr(data, function, _timed_step(step, getattr(data, function)))
+    dash._callback.to_json = _timed_step('serialize', dash._callback.to_json)
+
+    app.server.add_url_rule('/metrics', 'metrics',
+                            lambda: Response(exposition(), mimetype = 'text/plain; version=0.0.4'))
@@ -1,218 +1,229 @@
-import dash
 import dash_core_components as dcc
 import dash_html_components as html
-import plotly.express as px
-import pandas as pd
-import gspread
 import dash_bootstrap_components as dbc
-from dash.dependencies import Input, Output
-import plotly.graph_objects as go
-import numpy as np
+from dash import Patch, callback_context
+from dash.dependencies import ALL, Input, Output, State
+from dash.exceptions import PreventUpdate
 from app import app
-
-# --------------------------- Processing Information from the Google Sheet -------------------------------- 
-
-# Getting values from the google spreadsheet
-gc = gspread.service_account(filename = 'cred.json')
-sh = gc.open_by_key('1TFvNZqHILzKK7VttupYZgrSNgiZXkGlEicvc50VhGvM')
-
-# Generating a dataframe from the sheet 'P_inf'
-inf = sh.worksheet('P_inf')
-p_inf = inf.get_all_values()
-p_inf = pd.DataFrame.from_records(p_inf)
-p_inf.columns = list(p_inf.iloc[0])
-p_inf = p_inf.drop(0)
-print(p_inf)
-print()
-
-# Generating a dataframe from the sheet 'P_adverse'
-adv = sh.worksheet('P_adverse')
-p_adv = adv.get_all_values()
-p_adv = pd.DataFrame.from_records(p_adv)
-p_adv.columns = list(p_adv.iloc[0])
-p_adv = p_adv.drop(0)
-print(p_adv)
-print()
-
-# Get the ID string of the latest form response
-latest = sh.worksheet('Looking up latest')
-string = latest.get('F2') # ID string stored in F2 cell of sheet named 'Looking up latest'
-
-# Based on inputs from the user, an ID string is generated for each user. 
-# The input parameters are gender, city, age and whether they have diabetes and hypertension
-# Each parameter value is coded with a digit
-# eg: 1 for female and 2 for male
-# eg ID string: 11100
-gender, city, age, diabetes, hyper = list(string[0][0])
+from dropdowns import city_dropdown
+from gauges import REDS, gauge, pointer
+import data
+from cache import memoize
+from indicators import NO_DATA
+from risk import CREDIBLE, RISK_LIMIT, risk_model
 
 # --------------------------- Defining the App Layout -------------------------------- 
 
-layout = html.Div([
-    dcc.Store(id='risk_store', storage_type='session'), # Used to store a value that can be used across pages. 
-    # This will store the final value due to prevalence risk and will beused to calculate the overall risk later
-
-    dbc.Row(
-        html.H1("Risk Profile", style={'text-align': 'center'})
-    ),
-
-    dbc.Row([
-        # Dropdown for selecing gender
-        dbc.Col([
-            html.H3('Select your gender', style={'text-align': 'left'}),
-            dcc.Dropdown(id = 'gender', 
-            options = [
-                {'label': 'Male', 'value': 2}, 
-                {'label': 'Female', 'value': 1}
-            ],
-            value = gender, # By dafault, it displays the value chosen by the user when filling the form
-            placeholder = 'Select your gender',
-            persistence = True, persistence_type = 'memory' # So that the value selected by the user is retained even when the page is changed
-            )],
-            width={'size': 5, "offset": 1}
+def layout(profile):
+    gender, city, age, diabetes, hyper = profile # The codes chosen by the user when filling the form
+
+    return html.Div([
+        dcc.Store(id='risk_store', storage_type='session'), # Used to store a value that can be used across pages. 
+        # This will store the final value due to prevalence risk and will beused to calculate the overall risk later
+
+        dbc.Row(
+            html.H1("Risk Profile", style={'text-align': 'center'})
         ),
 
-        # Dropdown for selecing age
-        dbc.Col([
-            html.H3('Select your age', style={'text-align': 'left'}),
-            dcc.Dropdown(id = 'age', 
-            options = [
+        dbc.Row([
+            # Dropdown for selecing gender
+            dbc.Col([
+                html.H3('Select your gender', style={'text-align': 'left'}),
+                dcc.Dropdown(id = 'gender', 
+                options = [
+                    {'label': 'Male', 'value': 2}, 
+                    {'label': 'Female', 'value': 1}
+                ],
+                value = gender, # By dafault, it displays the value chosen by the user when filling the form
+                placeholder = 'Select your gender',
+                persistence = True, persistence_type = 'memory' # So that the value selected by the user is retained even when the page is changed
+                )],
+                width={'size': 5, "offset": 1}
+            ),
+
+            # Dropdown for selecing age
+            dbc.Col([
+                html.H3('Select your age', style={'text-align': 'left'}),
+                dcc.Dropdown(id = 'age', 
+                options = [
+                    {'label': 'Less than 20 years', 'value': 1}, 
+                    {'label': '20 to 50 years', 'value': 2},
+                    {'label': 'Greater than 50 years', 'value': 3}
+                ],
+                value = age, # By dafault, it displays the value chosen by the user when filling the form
+                persistence = True, persistence_type = 'memory', # So that the value selected by the user is retained even when the page is changed
+                placeholder = 'Select your age'
+                )],
+                width={'size': 5, "offset": 1}
+            )
+        ]),
+
+        dbc.Row([
+            # Dropdown for selecing city
+            dbc.Col([
+                html.H3('Select your City', style={'text-align': 'left'}),
+                city_dropdown(city)],
+            width={'size': 5, "offset": 1}
+            ),
+
+            # Dropdown for selecing if they have diabetes
+            dbc.Col([
+                html.H3('Do you have diabetes?', style={'text-align': 'left'}),
+                dcc.Dropdown(id = 'diabetes', options = [
+                    {'label': 'Have diabetes', 'value': 1}, 
+                    {'label': 'Don\'t have diabetes', 'value': 0}
+                    ],
+                value = diabetes, # By dafault, it displays the value chosen by the user when filling the form
+                persistence = True, persistence_type = 'memory', # So that the value selected by the user is retained even when the page is changed
+                placeholder = 'Do you have diabetes?'
+                )],
+            width={'size': 5, "offset": 1}
+            )
+        
+        ]),
+
+        dbc.Row([
+            # Dropdown for selecing if they have hypertension
+        
+            dbc.Col([
+                html.H3('Do you have hypertension?', style={'text-align': 'left'}),
+                dcc.Dropdown(id = 'hyper', options = [
+                    {'label': 'Have hypertension', 'value': 1}, 
+                    {'label': 'Don\'t have hypertension', 'value': 0}
+                    ],
+                value = hyper, # By dafault, it displays the value chosen by the user when filling the form
+                persistence = True, persistence_type = 'memory', # So that the value selected by the user is retained even when the page is changed
+                placeholder = 'Do you have hypertension?'
+                )],
+            width={'size': 5, "offset": 1}
+            )
+
+        ]),
+
+        html.H1("Household Members", style={'text-align': 'left'}),
+
+        # One set of dropdowns for each member of the household, see member below
+        # The details of the household members were not encoded in a string
+        # For the time being the household has one member with the details of the index person
+        # More members can be added and each of them changed or removed using the buttons
+        html.Div(id = 'household', children = [member(0, gender, age, diabetes, hyper)]),
+        dbc.Button('Add a household member', id = 'add_member', n_clicks = 0),
+
+        dbc.Row([
+            dbc.Col([
+                html.H2('Personal Risk'),
+                dcc.Graph(id='graph', figure=gauge(REDS, RISK_LIMIT, 0, 'Risk Profile')), # The callback only moves its pointer (see gauges.py)
+                html.Div(id='risk'),
+                # Shows how uncertain the risk is because the probabilities it is worked out from are estimates (see risk.py)
+                dbc.Switch(id = 'uncertainty', label = 'Show the uncertainty of the risk', value = False,
+                           persistence = True, persistence_type = 'memory')
+            ])
+        ])
+
+    ])
+
+def member(index, gender, age, diabetes, hyper):
+    # The dropdowns of one member of the household. Their ids are dictionaries with the type of the dropdown and
+    # the index of the member, so that the callbacks can take the values of every member at once (pattern matching)
+    return html.Div([
+        dbc.Row([
+            # Dropdown for selecing gender
+            html.H3('Select household member\'s gender', style={'text-align': 'left'}),
+            dbc.Col([dcc.Dropdown(
+                id = {'type': 'hh_gender', 'index': index}, 
+                options = [
+                    {'label': 'Male', 'value': 2}, 
+                    {'label': 'Female', 'value': 1}
+                ],
+                value = gender,
+                persistence = True, persistence_type = 'memory', # So that the value selected by the user is retained even when the page is changed
+                placeholder = 'Select your gender'
+            )
+        
+            ]),
+
+            # Dropdown for selecing age
+            html.H3('Select their age', style={'text-align': 'left'}),
+            dbc.Col([dcc.Dropdown(id = {'type': 'hh_age', 'index': index}, options = [
                 {'label': 'Less than 20 years', 'value': 1}, 
                 {'label': '20 to 50 years', 'value': 2},
                 {'label': 'Greater than 50 years', 'value': 3}
             ],
-            value = age, # By dafault, it displays the value chosen by the user when filling the form
+            value = age,
             persistence = True, persistence_type = 'memory', # So that the value selected by the user is retained even when the page is changed
             placeholder = 'Select your age'
-            )],
-            width={'size': 5, "offset": 1}
-        )
-    ]),
-
-    dbc.Row([
-        # Dropdown for selecing city
-        dbc.Col([
-            html.H3('Select your City', style={'text-align': 'left'}),
-            dcc.Dropdown(id = 'city', options = [
-                {'label': 'Delhi', 'value': 1}, 
-                {'label': 'Chennai', 'value': 2}
-                ],
-            value = city, # By dafault, it displays the value chosen by the user when filling the form
-            persistence = True, persistence_type = 'memory', # So that the value selected by the user is retained even when the page is changed
-            placeholder = 'Select your City'
-            )],
-        width={'size': 5, "offset": 1}
-        ),
+            )
 
-        # Dropdown for selecing if they have diabetes
-        dbc.Col([
-            html.H3('Do you have diabetes?', style={'text-align': 'left'}),
-            dcc.Dropdown(id = 'diabetes', options = [
+            ])
+        ]),
+
+        dbc.Row([
+            # Dropdown for selecing if they have diabetes
+            html.H3('Do they have diabetes?', style={'text-align': 'left'}),
+            dbc.Col([dcc.Dropdown(id = {'type': 'hh_diabetes', 'index': index}, options = [
                 {'label': 'Have diabetes', 'value': 1}, 
                 {'label': 'Don\'t have diabetes', 'value': 0}
-                ],
-            value = diabetes, # By dafault, it displays the value chosen by the user when filling the form
+            ],
+            value = diabetes,
             persistence = True, persistence_type = 'memory', # So that the value selected by the user is retained even when the page is changed
             placeholder = 'Do you have diabetes?'
-            )],
-        width={'size': 5, "offset": 1}
-        )
-        
-    ]),
+            )
 
-    dbc.Row([
-        # Dropdown for selecing if they have hypertension
+            ]),
         
-        dbc.Col([
-            html.H3('Do you have hypertension?', style={'text-align': 'left'}),
-            dcc.Dropdown(id = 'hyper', options = [
+            # Dropdown for selecing if they have hypertension
+            html.H3('Do they have hypertension?', style={'text-align': 'left'}),
+            dbc.Col([dcc.Dropdown(id = {'type': 'hh_hyper', 'index': index}, options = [
                 {'label': 'Have hypertension', 'value': 1}, 
                 {'label': 'Don\'t have hypertension', 'value': 0}
-                ],
-            value = hyper, # By dafault, it displays the value chosen by the user when filling the form
-            persistence = True, persistence_type = 'memory', # So that the value selected by the user is retained even when the page is changed
-            placeholder = 'Do you have hypertension?'
-            )],
-        width={'size': 5, "offset": 1}
-        )
-
-    ]),
-
-    html.H1("Household Member", style={'text-align': 'left'}),
-
-    dbc.Row([
-        # Dropdown for selecing gender
-        html.H3('Select household member\'s gender', style={'text-align': 'left'}),
-        dbc.Col([dcc.Dropdown(
-            id = 'hh_gender', 
-            options = [
-                {'label': 'Male', 'value': 2}, 
-                {'label': 'Female', 'value': 1}
             ],
-            # The details of the household member was not encoded in a string
-            # For the time being the details of the index person are used by default
-            # This can however be manually changed using the dropdown boxes
-            value = gender,
+            value = hyper,
             persistence = True, persistence_type = 'memory', # So that the value selected by the user is retained even when the page is changed
-            placeholder = 'Select your gender'
-        )
-        
-        ]),
+            placeholder = 'Do you have hypertension?'
+            )
 
-        # Dropdown for selecing age
-        html.H3('Select their age', style={'text-align': 'left'}),
-        dbc.Col([dcc.Dropdown(id = 'hh_age', options = [
-            {'label': 'Less than 20 years', 'value': 1}, 
-            {'label': '20 to 50 years', 'value': 2},
-            {'label': 'Greater than 50 years', 'value': 3}
-        ],
-        value = age,
-        persistence = True, persistence_type = 'memory', # So that the value selected by the user is retained even when the page is changed
-        placeholder = 'Select your age'
-        )
-
-        ])
-    ]),
-
-    dbc.Row([
-        # Dropdown for selecing if they have diabetes
-        html.H3('Do they have diabetes?', style={'text-align': 'left'}),
-        dbc.Col([dcc.Dropdown(id = 'hh_diabetes', options = [
-            {'label': 'Have diabetes', 'value': 1}, 
-            {'label': 'Don\'t have diabetes', 'value': 0}
-        ],
-        value = diabetes,
-        persistence = True, persistence_type = 'memory', # So that the value selected by the user is retained even when the page is changed
-        placeholder = 'Do you have diabetes?'
-        )
+            ])
 
         ]),
-        
-        # Dropdown for selecing if they have hypertension
-        html.H3('Do they have hypertension?', style={'text-align': 'left'}),
-        dbc.Col([dcc.Dropdown(id = 'hh_hyper', options = [
-            {'label': 'Have hypertension', 'value': 1}, 
-            {'label': 'Don\'t have hypertension', 'value': 0}
-        ],
-        value = hyper,
-        persistence = True, persistence_type = 'memory', # So that the value selected by the user is retained even when the page is changed
-        placeholder = 'Do you have hypertension?'
-        )
 
-        ])
+        dbc.Button('Remove this member', id = {'type': 'remove_member', 'index': index}, n_clicks = 0)
+    ])
 
-    ]),
+# --------------------------- The Backend Processing for Calculating and Displaying Outputs -------------------------------- 
 
-    dbc.Row([
-        dbc.Col([
-            html.H2('Personal Risk'),
-            dcc.Graph(id='graph'), 
-            html.Div(id='risk')
-        ])
-    ])
+HOUSEHOLD_LIMIT = 20 # Most members that can be added to the household
 
-])
 
-# --------------------------- The Backend Processing for Calculating and Displaying Outputs -------------------------------- 
+@app.callback(
+    # Defining what to expect as output
+    [Output(component_id = 'household', component_property = 'children'),
+    Output(component_id = 'add_member', component_property = 'disabled')],
+    # Defining what to expect as input
+    [Input(component_id = 'add_member', component_property = 'n_clicks'),
+    Input(component_id = {'type': 'remove_member', 'index': ALL}, component_property = 'n_clicks')],
+    [State(component_id = 'gender', component_property = 'value'),
+    State(component_id = 'age', component_property = 'value'),
+    State(component_id = 'diabetes', component_property = 'value'),
+    State(component_id = 'hyper', component_property = 'value')],
+    prevent_initial_call = True
+)
+def update_household(added, removed, gender, age, diabetes, hyper):
+    # Only the member added or removed is sent to the browser, the others are left as they are (see gauges.py)
+    household = Patch()
+    members = len(removed)
+    if callback_context.triggered_id == 'add_member':
+        # The number of clicks is used as the index of the new member, so that every member gets a different one
+        household.append(member(added, gender, age, diabetes, hyper))
+        members += 1
+    else:
+        # The callback is also run when a member is added, with no click on any of the remove buttons
+        if not callback_context.triggered[0]['value']:
+            raise PreventUpdate
+        ids = [remove['id'] for remove in callback_context.inputs_list[1]]
+        del household[ids.index(callback_context.triggered_id)]
+        members -= 1
+    return household, members >= HOUSEHOLD_LIMIT
+
 
 @app.callback(
     # Defining what to expect as output
@@ -225,74 +236,53 @@ layout = html.Div([
     Input(component_id = 'city', component_property = 'value'),
     Input(component_id = 'diabetes', component_property = 'value'),
     Input(component_id = 'hyper', component_property = 'value'),
-    Input(component_id = 'hh_gender', component_property = 'value'), 
-    Input(component_id = 'hh_age', component_property = 'value'),
-    Input(component_id = 'hh_diabetes', component_property = 'value'),
-    Input(component_id = 'hh_hyper', component_property = 'value')]
+    # The values of every member of the household, in the order they are on the page
+    # Their gender doesn't change their risk so it isn't needed
+    Input(component_id = {'type': 'hh_age', 'index': ALL}, component_property = 'value'),
+    Input(component_id = {'type': 'hh_diabetes', 'index': ALL}, component_property = 'value'),
+    Input(component_id = {'type': 'hh_hyper', 'index': ALL}, component_property = 'value'),
+    Input(component_id = 'uncertainty', component_property = 'value')]
 )
-def update_graph(gender_up, age_up, city_up, diab_up, hyper_up, gender_hh, age_hh, diab_hh, hyper_hh):
-
-    # the dataframe generated from the sheet stores all values as String
-    gender_up = str(gender_up)
-    age_up = str(age_up)
-    city_up = str(city_up)
-    diab_up = str(diab_up)
-    hyper_up = str(hyper_up)
-
-    gender_hh = str(gender_hh)
-    age_hh = str(age_hh)
-    diab_hh = str(diab_hh)
-    hyper_hh = str(hyper_hh)
-
-    # -------------------- Calculating the risk profile of index person ------------------------
-    # Get probability of infection from DataFrame
-    p_infection = float(p_inf[(p_inf['Gender'] == gender_up) & (p_inf['City_code'] == city_up)]['Prob']) 
-    # Get probability of adverse effect from DataFrame
-    hosp_death = p_adv[(p_adv['Age'] == age_up) & (p_adv['Diabetes'] == diab_up) & (p_adv['Hypertension'] == hyper_up)]
-    p_adverse = float(hosp_death['Hosp']) + float(hosp_death['Death'])
-    # Calculate risk profile by multiplying
-    risk = p_infection*p_adverse*100
-
-    # Calculate the probability of adverse affect for Household member
-    SAR = 0.2
-    hosp_death_hh = p_adv[(p_adv['Age'] == age_hh) & (p_adv['Diabetes'] == diab_hh) & (p_adv['Hypertension'] == hyper_hh)]
-    p_adverse_hh = float(hosp_death_hh['Hosp']) + float(hosp_death_hh['Death'])
-    # Update the risk profile by adding the risk faced byt eh household member
-    # The risk of the household member is  aproduct of prob. of infection, prob. of adverse affect and SAR
-    risk += p_infection*SAR*p_adverse_hh*100
-
-    # Get the names of all indicators or 'fields'
-    f = 'Risk Profile' # Here, there is only one indicator
-    limit = 15 # Define the upper limit of this indicator. 
-    # This is not a theoretical limit and is a choice based on observed values
+def update_graph(gender_up, age_up, city_up, diab_up, hyper_up, age_hh, diab_hh, hyper_hh, uncertain):
+
+    # -------------------- Calculating the risk profile of index person and household members ------------------------
+    # The probabilities of every member are looked up in one go and combined into the probability
+    # that at least one of them has an adverse effect (see risk.py)
+    # Members whose details haven't all been selected are left out
+    members = [[int(code) for code in codes] for codes in zip(age_hh, diab_hh, hyper_hh) if None not in codes]
+    codes = [int(code) for code in (gender_up, city_up, age_up, diab_up, hyper_up)]
+    model = data.current().get(risk_model)
+    if not model.covers(*codes, members):
+        # The city isn't in the sheet 'P_inf' (or the codes aren't in 'P_adverse'), so the risk can't be worked out
+        # Nothing is stored, so the Overall Risk page doesn't use it
+        return (pointer(0, (0, 0)), NO_DATA, None)
+    risk = float(model.risks(*codes, members))
+
+    limit = RISK_LIMIT # Define the upper limit of this indicator (see risk.py)
     
-    fig = go.Figure()
-
-    fig.add_trace(go.Indicator(
-        mode = "gauge",
-        value = risk,
-        delta = {'reference': limit},
-        domain = {'x': [0, 1], 'y': [0, 1]},
-        title = {'text': f},
-        gauge = {
-            'shape': "bullet",
-            'axis': {'range': [None, limit]},
-            'steps': [
-                # Set the colour for each threshold range
-                {'range': [0, limit/4], 'color': '#fbc4ab'},
-                {'range': [limit/4, limit/2], 'color': '#f8ad9d'},
-                {'range': [limit/2, limit*3/4], 'color': '#f4978e'},
-                {'range': [limit*3/4, limit], 'color': '#f08080'}],
-            'bar': {'color': '#FFFFFF'}})) # Set the clour of the horizontal pointer bar to white
-
-    fig.update_layout(height = 80, margin = {'t':0, 'b':0, 'l':0})
-
-    level = int(risk*4/limit)
+    fig = pointer(risk, (risk, risk)) # Move the pointer of the linear gauge 'Risk Profile'
     text = {0:'very low', 1:'low', 2:'high', 3:'very high'} # Assign text levels for each indicator value
 
-    # output the linear gauge figure, the text level and the normalised value of the indicator
+    shown = risk # The risk the pointer and the text level are set to
+    if uncertain:
+        # The pointer is set to the median of the risk and its credible interval is shaded on the gauge
+        # Only what is shown changes, the Overall Risk page still uses the risk itself
+        low, shown, high = risk_interval(gender_up, city_up, age_up, diab_up, hyper_up, members)
+        fig = pointer(shown, (low, min(high, limit)))
+
+    level = min(int(shown*4/limit), 3) # The highest level also covers the upper limit and above
+    description = text[level]
+    if uncertain:
+        description += ' - median %.2f, %d%% credible interval %.2f to %.2f' % (shown, CREDIBLE*100, low, high)
+
+    # output the position of the pointer, the text level and the normalised value of the indicator
     # This will be used in a different page to calculate the overall risk
-    return (fig, text[level], risk/limit) 
+    return (fig, description, risk/limit) 
+
+
+@memoize('p_inf', 'p_adv') # The interval of each profile is only worked out once for each version of the data
+def risk_interval(gender, city, age, diabetes, hyper, members):
+    return data.current().get(risk_model).interval(gender, city, age, diabetes, hyper, members)
 
 if __name__ == '__main__':
     app.run_server(debug=True)
\ No newline at end of file
@@ -1,94 +1,105 @@
-import dash
+from functools import lru_cache
+
 import dash_core_components as dcc
 import dash_html_components as html
-import plotly.express as px
-import pandas as pd
-import gspread
+import plotly.graph_objects as go
+from plotly.colors import qualitative
 import dash_bootstrap_components as dbc
+from dash import callback_context
 from dash.dependencies import Input, Output
-import plotly.graph_objects as go
-import numpy as np
 from app import app
+from dropdowns import city_dropdown
+from cache import memoize
+import data
+from indicators import city_indicators, place_groups
 
-# --------------------------- Processing Information from the Google Sheet -------------------------------- 
-
-# Getting values from the google spreadsheet
-gc = gspread.service_account(filename = 'cred.json')
-sh = gc.open_by_key('1TFvNZqHILzKK7VttupYZgrSNgiZXkGlEicvc50VhGvM')
+# --------------------------- Defining the App Layout -------------------------------- 
 
-# Generating a dataframe from the sheet 'Transmission'
-trans = sh.worksheet('Transmission')
-transmission = trans.get_all_values()
-transmission = pd.DataFrame.from_records(transmission)
-transmission.columns = list(transmission.iloc[0]) # Reassigning the first row as column names
-transmission = transmission.drop(0)
+def layout(profile):
+    gender, city, age, diabetes, hyper = profile # The codes chosen by the user when filling the form
 
-# Get the ID string of the latest form response
-latest = sh.worksheet('Looking up latest')
-string = latest.get('F2') # ID string stored in F2 cell of sheet named 'Looking up latest'
+    return dbc.Container([
+        html.H1("Transmission", style={'text-align': 'center'}),
+        dcc.Store(id='trans_store', storage_type='session'), # Used to store a value that can be used across pages. 
+        # This will store the final value due to health system risk and will beused to calculate the overall risk later
 
-# Based on inputs from the user, an ID string is generated for each user. 
-# The input parameters are gender, city, age and whether they have diabetes and hypertension
-# Each parameter value is coded with a digit
-# eg: 1 for female and 2 for male
-# eg ID string: 11100
-gender, city, age, diabetes, hyper = list(string[0][0])
+        dbc.Row([
 
-# --------------------------- Defining the App Layout -------------------------------- 
+            # Dropdown for selecing city
+            html.H3('Select your City', style={'text-align': 'left'}),
+            dbc.Col([city_dropdown(city)])
 
-layout = dbc.Container([
-    html.H1("Transmission", style={'text-align': 'center'}),
-    dcc.Store(id='trans_store', storage_type='session'), # Used to store a value that can be used across pages. 
-    # This will store the final value due to health system risk and will beused to calculate the overall risk later
+        ]),
 
-    dbc.Row([
+        # Placeholders for graphs/figures
+        dbc.Row([html.H2('Transmission'), dcc.Graph(id='trans')]),
 
-        # Dropdown for selecing city
-        html.H3('Select your City', style={'text-align': 'left'}),
-        dbc.Col([dcc.Dropdown(id = 'city', options = [
-            {'label': 'Delhi', 'value': 1},
-            {'label': 'Chennai', 'value': 2}
-        ],
-        value = city, # By dafault, it displays the value chosen by the user when filling the form
-        persistence = True, persistence_type = 'memory', # So that the value selected by the user is retained even when the page is changed
-        placeholder = 'Select your City'
-        )
+        html.Div(id='trial')
 
-        ])
+    ])
 
-    ]),
+# --------------------------- The Backend Processing for Calculating and Displaying Outputs -------------------------------- 
 
-    # Placeholders for graphs/figures
-    dbc.Row([html.H2('Transmission'), dcc.Graph(id='trans')]),
+COLOURS = qualitative.Plotly # The colour of the bars of each type, in the order the types appear in the sheet
 
-    html.Div(id='trial')
 
-])
+@lru_cache(maxsize = None)
+def _layout():
+    # The layout of the bar graph, the same for every city
+    fig = go.Figure(layout = {'barmode': 'group', 'width': 1500, 'height': 500, 'margin': {'t': 60},
+                              'legend': {'title': {'text': 'Type'}, 'tracegroupgap': 0},
+                              'xaxis': {'anchor': 'y', 'domain': [0.0, 1.0], 'title': {'text': 'Place'}},
+                              'yaxis': {'anchor': 'x', 'domain': [0.0, 1.0], 'title': {'text': 'Transmission'}}})
+    return fig.to_plotly_json()['layout']
 
-# --------------------------- The Backend Processing for Calculating and Displaying Outputs -------------------------------- 
 
 @app.callback(
     # Defining what to expect as output
-    [Output(component_id = 'trans', component_property = 'figure'),
-    Output(component_id = 'trans_store', component_property = 'data'),
-    ],
+    Output(component_id = 'trans', component_property = 'figure'),
     # Defining what to expect as input
     Input(component_id = 'city', component_property = 'value')
 )
+@memoize('transmission') # Every user who selects the same city gets the same outputs (see cache.py)
 def update_graph(city_up):
 
-    city_up = str(city_up) # the dataframe generated from the sheet stores all values as String
+    city_up = int(city_up) # City codes are stored as integers in the dataframe
+
+    # Get the places of the selected city, already grouped by their type when the data was loaded (see indicators.py)
+    places = data.current().get(place_groups)
+
+    # Generate a bar graph with the values for transmission, with a group of bars for each type of place
+    traces = []
+    for kind, names, values in places.groups.get(city_up, []):
+        traces.append({
+            'type': 'bar', 'name': kind, 'x': names, 'y': values, 'orientation': 'v',
+            'marker': {'color': COLOURS[places.types.index(kind) % len(COLOURS)]},
+            'legendgroup': kind, 'offsetgroup': kind, 'alignmentgroup': 'True', 'showlegend': True,
+            'hovertemplate': 'Type=' + kind + '<br>Place=%{x}<br>Transmission=%{y}<extra></extra>'
+        })
+
+    return {'data': traces, 'layout': _layout()}
+
+
+@app.callback(
+    [Output(component_id = 'trans_store', component_property = 'data'),
+    Output(component_id = 'trial', component_property = 'children')],
+    [Input(component_id = 'trans', component_property = 'clickData'),
+    Input(component_id = 'city', component_property = 'value')]
+)
+def select_place(click, city_up):
 
-    # Get the transmission values for the selected city
-    data = transmission[transmission['City_code'] == city_up]
-    data = data.astype({'Transmission': float})
+    # The transmission value of the bar clicked by the user is used as the transmission risk for calculating overall risk
+    # Until a bar is clicked (again after the city is changed), the value of the city is used (see indicators.py)
+    if callback_context.triggered_id != 'trans' or not click:
+        return (data.current().get(city_indicators).scores(int(city_up))['transmission'],
+                'Click on the place you are most likely to go to')
 
-    # Generate a bar graph with the values for transmission
-    fig = px.bar(data, x = 'Place', y = 'Transmission', orientation='v', color = 'Type', barmode = 'group', width = 1500, height = 500)
-    trans = 10 # Ideally the bar graph will be interactive and the value corresponding to the bar chosen by the user will be used as the transmisson risk for caluculating overall risk
+    point = click['points'][0]
+    trans = point['y']
+    text = 'Transmission risk at %s: %s' % (point['x'], trans)
 
-    # Return the bar graph and the value to be passed on to the page for calculating overall risk
-    return (fig, trans/100)
+    # Return the value to be passed on to the page for calculating overall risk
+    return (trans/100, text)
 
 if __name__ == '__main__':
-    app.run_server(debug=True)
\ No newline at end of file
+    app.run_server(debug=True)
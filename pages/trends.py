@@ -0,0 +1,140 @@
+from functools import lru_cache
+
+import dash_core_components as dcc
+import dash_html_components as html
+import numpy as np
+import plotly.io as pio
+from plotly.subplots import make_subplots
+import dash_bootstrap_components as dbc
+from dash import callback_context
+from dash.dependencies import Input, Output
+from app import app
+from dropdowns import city_dropdown
+from cache import memoize
+import data
+from indicators import prevalence_history
+
+# --------------------------- Defining the App Layout --------------------------------
+
+def layout(profile):
+    gender, city, age, diabetes, hyper = profile # The codes chosen by the user when filling the form
+
+    return dbc.Container([
+        html.H1("Trends", style={'text-align': 'center'}), # Heading
+
+        dbc.Row([
+
+            # Dropdown for selecing city
+            html.H3('Select your City', style={'text-align': 'left'}),
+            dbc.Col([city_dropdown(city)])
+
+        ]),
+
+        # Placeholder for the graph of the active cases, growth rate and prevalence level on every day in Prevalence_Live
+        dbc.Row([dcc.Graph(id='trends_fig')])
+
+    ])
+
+# --------------------------- The Backend Processing for Calculating and Displaying Outputs --------------------------------
+
+# The history of a city can be years long, much longer than there are pixels to draw it on
+# Only the lowest and the highest value of each of POINTS/2 equal stretches of days is sent to the browser,
+# so the peaks and troughs are all there however long the history is. Zooming in sends the days in view in more detail
+# The lines are drawn with WebGL (scattergl), which stays smooth with many points
+
+POINTS = 200 # Most points sent for each line
+SERIES = [('Active cases', 'active'), ('Growth rate of new cases', 'growth'), ('Prevalence level', 'prevalence')]
+
+
+def downsample(x, y, points = POINTS):
+    # The points with the lowest and the highest value in each stretch, in the order of x. Missing values are left out
+    known = ~np.isnan(y)
+    x, y = x[known], y[known]
+    if len(y) <= points:
+        return x, y
+
+    width = -(-len(y) // (points // 2)) # Rounded up, so the last stretch may be shorter
+    buckets = -(-len(y) // width)
+    padded = np.full(buckets * width, np.nan)
+    padded[:len(y)] = y
+    padded = padded.reshape(buckets, -1)
+    starts = np.arange(buckets) * width
+    keep = np.unique(np.concatenate([starts + np.nanargmin(padded, axis = 1), starts + np.nanargmax(padded, axis = 1)]))
+    return x[keep], y[keep]
+
+
+@lru_cache(maxsize = None)
+def _layout():
+    # The layout of the graph, the same for every city
+    fig = make_subplots(rows = 3, cols = 1, shared_xaxes = True, vertical_spacing = 0.06,
+                        subplot_titles = [title for title, name in SERIES])
+    fig.update_layout(height = 750, showlegend = False, margin = {'t': 40})
+    fig.update_xaxes(title_text = 'Day', row = 3, col = 1)
+    fig.update_yaxes(range = [0.5, 4.5], dtick = 1, row = 3, col = 1) # The four levels (see levels.py)
+    layout = fig.to_plotly_json()['layout']
+    # Only the part of the template used by line graphs, the rest of it would make every response several times larger
+    layout['template'] = {'layout': pio.templates[pio.templates.default].layout.to_plotly_json()}
+    return layout
+
+
+def _window(relayout, days):
+    # The days in view after the user zooms, as whole days within the history, or None when the whole history is in view
+    if not relayout or any(key.endswith('autorange') for key in relayout):
+        return None
+    ranges = [(relayout[key], relayout[key.replace('[0]', '[1]')]) for key in relayout
+              if key.startswith('xaxis') and key.endswith('.range[0]') and key.replace('[0]', '[1]') in relayout]
+    if not ranges:
+        return None
+    start, end = ranges[0]
+    start, end = max(0, int(np.floor(start))), min(days - 1, int(np.ceil(end)))
+    return (start, end) if start < end else None
+
+
+@memoize('live') # The lines of each city and zoom window are only worked out once for each version of the data
+def trend(city, window):
+    live = data.current()['live']
+    history = data.current().get(prevalence_history)
+    days = len(live)
+    if 'active_%d' % city not in live.columns:
+        return [] # No history for this city
+    x = days - 1 - np.arange(days) # Day 0 is the first day in the sheet, the latest day is at the top of the sheet
+
+    values = {'active': live['active_%d' % city].to_numpy(dtype = float),
+              'growth': live['growth_%d' % city].to_numpy(dtype = float),
+              'prevalence': history['prevalence'][city].to_numpy(dtype = float)}
+    values['prevalence'][values['prevalence'] == 0] = np.nan # Level 0 means the level isn't known on that day
+
+    traces = []
+    for row, (title, name) in enumerate(SERIES, start = 1):
+        days_x, days_y = x[::-1], values[name][::-1] # Oldest day first
+        if window is not None:
+            days_x, days_y = days_x[window[0]:window[1] + 1], days_y[window[0]:window[1] + 1]
+        days_x, days_y = downsample(days_x, days_y)
+        traces.append({
+            'type': 'scattergl', 'mode': 'lines', 'name': title, 'x': days_x.tolist(), 'y': days_y.tolist(),
+            'xaxis': 'x' if row == 1 else 'x%d' % row, 'yaxis': 'y' if row == 1 else 'y%d' % row,
+            'line': {'shape': 'hv'} if name == 'prevalence' else {}
+        })
+    return traces
+
+
+@app.callback(
+    # Defining what to expect as output
+    Output(component_id = 'trends_fig', component_property = 'figure'),
+    # Defining what to expect as input
+    [Input(component_id = 'city', component_property = 'value'),
+    Input(component_id = 'trends_fig', component_property = 'relayoutData')]
+)
+def update_graph(city_up, relayout):
+
+    city_up = int(city_up) # City codes are stored as integers in the dataframe
+    days = len(data.current()['live'])
+
+    # The zoom of the previous city doesn't apply to a new one
+    window = _window(relayout, days) if callback_context.triggered_id == 'trends_fig' else None
+    traces = trend(city_up, window)
+    # The zoom is kept while the city stays the same (uirevision), and only the points sent are changed
+    return {'data': traces, 'layout': dict(_layout(), uirevision = city_up)}
+
+if __name__ == '__main__':
+    app.run_server(debug=True)
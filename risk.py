@@ -0,0 +1,187 @@
+from functools import lru_cache
+
+import numpy as np
+
+import data
+
+# --------------------------- The Risk Profile Model --------------------------------
+
+# The risk of the index person is the product of their probability of infection and of an adverse effect
+# (hospitalisation or death). The risk of their household is added to it, which is the product of
+# the probability of infection of the index person and the probability that at least one member of the
+# household has an adverse effect after being infected by them: 1 - (1 - SAR*adverse_1)*(1 - SAR*adverse_2)*...
+# where SAR is the secondary attack rate and adverse_i the probability of an adverse effect of member i
+# With a single member this is the product of the SAR and their probability of an adverse effect
+
+SAR = 0.2 # Secondary attack rate
+RISK_LIMIT = 15 # Upper limit of the risk gauge. This is not a theoretical limit and is a choice based on observed values
+
+# The probabilities in the sheets and the SAR are estimates. To show how uncertain the risk is because of that,
+# each of them can be drawn from a distribution around its estimate and the risk worked out for every draw
+# A probability p is drawn as a logit-normal, the logit of p plus UNCERTAINTY times a standard normal, so the draws
+# stay between 0 and 1 and are spread more for the probabilities that are less certain (0 keeps p fixed)
+# The same standard normals are used every time, so a profile always gets the same interval
+# and working it out only takes a few operations on arrays of DRAWS values
+UNCERTAINTY = {'infection': 0.3, 'hosp': 0.4, 'death': 0.5, 'sar': 0.3}
+DRAWS = 100000
+GROUPS = 12 # Groups of age, diabetes and hypertension in 'P_adverse', each has its own standard normals
+CREDIBLE = 0.9 # Share of the draws within the credible interval, the rest are split equally below and above it
+
+# A household is given as the codes (age, diabetes, hypertension) of each of its members
+# Households of different sizes are scored together by padding the smaller ones with NO_MEMBER
+NO_MEMBER = (0, 0, 0) # Age 0 is not a group in the sheets
+
+
+class RiskModel:
+    # The probabilities from the sheets 'P_inf' and 'P_adverse' as arrays indexed directly by the codes of the ID string
+    # infection[gender, city] and hosp, death and adverse (either of them) [age, diabetes, hypertension]
+    # Combinations that are not in the sheets are NaN
+
+    def __init__(self, infection, hosp, death):
+        self.infection = infection
+        self.hosp = hosp
+        self.death = death
+        self.adverse = adverse = hosp + death
+
+        # The risk for every combination of the index person and the household member
+        # risk[gender, city, age, diabetes, hyper, hh_age, hh_diabetes, hh_hyper]
+        # The operations are done in the same order as in the formula so that the values are exactly the same
+        infection = infection[:, :, None, None, None]
+        personal = infection*adverse*100
+        household = infection*SAR*adverse*100
+        self.risk = personal[..., None, None, None] + household[:, :, None, None, None]
+
+        # The groups in 'P_adverse' in order, the position of a group gives its rows of standard normals (see draws)
+        self.groups = {tuple(int(code) for code in group): i for i, group in enumerate(np.argwhere(~np.isnan(adverse)))}
+        self._draws = {} # The draws that are the same for every profile, kept once they have been worked out
+
+    def covers(self, gender, city, age, diabetes, hyper, members = ()):
+        # Whether the sheets have the probabilities of the index person and of every member of their household
+        # Cities can be in the other sheets but not in 'P_inf', and their risk can't be worked out
+        if not (0 <= gender < self.infection.shape[0] and 0 <= city < self.infection.shape[1]) or \
+                np.isnan(self.infection[gender, city]):
+            return False
+        groups = [(age, diabetes, hyper)] + [tuple(member) for member in members if tuple(member) != NO_MEMBER]
+        return all(0 <= age < self.adverse.shape[0] and diabetes in (0, 1) and hyper in (0, 1) and
+                   not np.isnan(self.adverse[age, diabetes, hyper]) for age, diabetes, hyper in groups)
+
+    def lookup(self, gender, city, age, diabetes, hyper, hh_age, hh_diabetes, hh_hyper):
+        # The risk with a household of one member
+        return float(self.risk[int(gender), int(city), int(age), int(diabetes), int(hyper),
+                               int(hh_age), int(hh_diabetes), int(hh_hyper)])
+
+    def household(self, members):
+        # The probability that at least one member of a household has an adverse effect once the index person is infected
+        # members[..., member] holds the codes of each member, so an array of shape (people, members, 3) gives
+        # one probability for each person. The adverse effects of every member are gathered from the table at once
+        members = np.asarray(members, dtype = np.intp)
+        if members.ndim == 1:
+            members = members.reshape(-1, 3) # An empty household
+        age, diabetes, hyper = np.moveaxis(members, -1, 0)
+        adverse = np.where(age > 0, self.adverse[age, diabetes, hyper], 0) # NO_MEMBER never has an adverse effect
+        # The probability that none of them has one is a product, added up as logarithms
+        return -np.expm1(np.log1p(-SAR*adverse).sum(axis = -1))
+
+    def risks(self, gender, city, age, diabetes, hyper, members):
+        # The risk of each person with their own household, given as arrays of codes (or single codes)
+        # and members as in household. It doesn't take longer for larger households
+        infection = self.infection[gender, city]
+        return infection*self.adverse[age, diabetes, hyper]*100 + infection*self.household(members)*100
+
+    def draws(self, gender, city, age, diabetes, hyper, members, draws = DRAWS):
+        # The risk for each draw of the probabilities and the SAR (see UNCERTAINTY)
+        # The draws of each group are shared by everyone in it and by every profile, so only the probability of
+        # infection is drawn for each profile. It takes about as long for every household
+        person = (int(age), int(diabetes), int(hyper))
+        counts = {} # Group: number of members in it
+        for member in members:
+            member = tuple(int(code) for code in member)
+            if member != NO_MEMBER:
+                counts[member] = counts.get(member, 0) + 1
+
+        # The logarithm of the probability that no member has an adverse effect, as in household
+        risk = np.zeros(draws, dtype = np.float32)
+        for group, count in counts.items():
+            risk += np.float32(count) * self._group(group, draws)[1]
+        np.expm1(risk, out = risk)
+        np.subtract(self._group(person, draws)[0], risk, out = risk)
+        risk *= _draw(self.infection[int(gender), int(city)], UNCERTAINTY['infection'], self._normals(draws)[0])
+        risk *= 100
+        return risk # infection*adverse*100 + infection*(1 - (1 - sar*adverse_1)*...)*100
+
+    def _normals(self, draws):
+        # Row 0 for the probability of infection, row 1 for the SAR and two rows for each group
+        return _normals(2 + 2*max(GROUPS, len(self.groups)), draws)
+
+    def _group(self, group, draws):
+        # The draws of the probability of an adverse effect of a group, and of log(1 - sar*adverse) for a member of it
+        # NaN for a group that isn't in the sheets
+        key = (group, draws)
+        if key not in self._draws:
+            normals = self._normals(draws)
+            if ('sar', draws) not in self._draws:
+                self._draws[('sar', draws)] = _draw(SAR, UNCERTAINTY['sar'], normals[1])
+            sar = self._draws[('sar', draws)]
+            if group in self.groups:
+                row = 2 + 2*self.groups[group]
+                adverse = _draw(self.hosp[group], UNCERTAINTY['hosp'], normals[row]) + \
+                    _draw(self.death[group], UNCERTAINTY['death'], normals[row + 1])
+            else:
+                adverse = np.full(draws, np.nan, dtype = np.float32)
+            term = np.multiply(adverse, -sar)
+            np.log1p(term, out = term)
+            adverse.setflags(write = False)
+            term.setflags(write = False)
+            self._draws[key] = (adverse, term)
+        return self._draws[key]
+
+    def interval(self, *codes):
+        # The median of the risk and the bounds of its credible interval
+        tail = (1 - CREDIBLE) / 2 * 100
+        low, median, high = np.percentile(self.draws(*codes), [tail, 50, 100 - tail])
+        return float(low), float(median), float(high)
+
+
+@lru_cache(maxsize = 1)
+def _normals(rows, draws):
+    # One row of standard normals for each probability drawn, see RiskModel.draws
+    # They are the same every time, so each profile always gets the same interval
+    # Single precision is plenty for an interval and makes working it out about twice as quick
+    normals = np.random.default_rng(0).standard_normal((rows, draws), dtype = np.float32)
+    normals.setflags(write = False)
+    return normals
+
+
+def _draw(p, spread, normals):
+    # Logit-normal draws around the probability p, a probability of 0 or 1 stays the same
+    # Each step is done in place, so only one array of DRAWS values is allocated
+    with np.errstate(divide = 'ignore', over = 'ignore'):
+        logit = np.float32(np.log(p) - np.log1p(-p))
+        draws = np.multiply(normals, np.float32(-spread))
+        draws -= logit
+        np.exp(draws, out = draws)
+        draws += 1
+        return np.reciprocal(draws, out = draws)
+
+
+@data.derived
+def risk_model(snapshot):
+    p_inf = snapshot['p_inf']
+    p_adv = snapshot['p_adv']
+
+    # Get probability of infection for each gender and city
+    gender = p_inf['Gender'].to_numpy()
+    city = p_inf['City_code'].to_numpy()
+    infection = np.full((gender.max() + 1, city.max() + 1), np.nan)
+    infection[gender, city] = p_inf['Prob'].to_numpy()
+
+    # Get probability of adverse effect for each age group and comorbidity
+    age = p_adv['Age'].to_numpy()
+    diabetes = p_adv['Diabetes'].to_numpy()
+    hyper = p_adv['Hypertension'].to_numpy()
+    hosp = np.full((age.max() + 1, 2, 2), np.nan)
+    death = np.full((age.max() + 1, 2, 2), np.nan)
+    hosp[age, diabetes, hyper] = p_adv['Hosp'].to_numpy()
+    death[age, diabetes, hyper] = p_adv['Death'].to_numpy()
+
+    return RiskModel(infection, hosp, death)
@@ -0,0 +1,200 @@
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import data
+from indicators import city_indicators
+from risk import NO_MEMBER, RISK_LIMIT, risk_model
+
+# --------------------------- Scoring Form Responses in Bulk --------------------------------
+
+# Scores a whole export of form responses, given as a CSV or Parquet file with one ID string per row
+# The file is read in chunks which are scored in parallel by a pool of processes
+#
+# python score.py responses.csv scores.csv --column ID --household Household
+#
+# Each output row has the ID string, the personal risk, the levels of the city indicators and the overall risk level
+# The household of each person can be given in another column, with three digits for the age, diabetes and
+# hypertension codes of each member separated by spaces, eg. '311 200' for two members. Without it the household
+# has one member with the same age and comorbidities as the index person, as on the Risk Profile page when it opens
+# Rows with an invalid ID string or household are kept with empty scores
+
+OUTPUT_COLUMNS = ['risk', 'risk_level', 'health_level', 'prevalence_level', 'transmission', 'overall_level']
+
+
+class Scorer:
+    # Only the arrays needed for scoring, so that they are cheap to send to the worker processes
+
+    def __init__(self, model, health, prevalence, transmission):
+        self.model = model
+        self.health = health
+        self.prevalence = prevalence
+        self.transmission = transmission
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        indicators = snapshot.get(city_indicators)
+        return cls(snapshot.get(risk_model), indicators.health, indicators.prevalence, indicators.transmission)
+
+    def score(self, ids, households = None):
+        # Break every ID string into its five digits in one go
+        strings = np.asarray(ids, dtype = 'U6') # Longer strings are cut to 6 characters so they still fail the length check
+        valid = np.char.str_len(strings) == 5
+        digits = strings.astype('U5').view(np.uint32).reshape(-1, 5) - ord('0')
+        valid &= (digits <= 9).all(axis = 1)
+        gender, city, age, diabetes, hyper = digits.astype(np.intp).T
+
+        # Codes that are not in the sheets are invalid as well
+        model = self.model
+        valid &= (gender < model.infection.shape[0]) & (city < model.infection.shape[1]) & (age < model.adverse.shape[0])
+        valid &= (diabetes < 2) & (hyper < 2) & (city < len(self.health))
+        gender, city, age, diabetes, hyper = [np.where(valid, codes, 0) for codes in (gender, city, age, diabetes, hyper)]
+
+        if households is None:
+            risk = model.risk[gender, city, age, diabetes, hyper, age, diabetes, hyper]
+        else:
+            # The members of every household are scored at once, see RiskModel.household
+            members, known = household_codes(households)
+            valid &= known & (members[..., 0] < model.adverse.shape[0]).all(axis = 1) & (members[..., 1:] < 2).all(axis = (1, 2))
+            members[~valid] = NO_MEMBER
+            risk = model.risks(gender, city, age, diabetes, hyper, members)
+        # Codes within the shape of the tables that have no probability in the sheets (eg. gender 0) give no risk
+        valid &= ~np.isnan(risk)
+        health = self.health[city]
+        prevalence = self.prevalence[city]
+        transmission = self.transmission[city]
+
+        # The normalised values are added up the same way as on the Overall Risk page
+        overall = health/4 + prevalence/4 + transmission/100 + risk/RISK_LIMIT
+
+        scores = pd.DataFrame({
+            'risk': risk,
+            'risk_level': np.minimum(np.floor(risk*4/RISK_LIMIT), 3) + 1,
+            'health_level': health,
+            'prevalence_level': prevalence,
+            'transmission': transmission,
+            'overall_level': np.minimum(np.floor(overall), 3) + 1
+        })
+        scores[~valid] = np.nan
+        return scores.astype({'risk_level': 'Int8', 'health_level': 'Int8', 'prevalence_level': 'Int8', 'overall_level': 'Int8'})
+
+
+def household_codes(households):
+    # The codes of the members of each household as an array of shape (households, members, 3), the smaller
+    # households padded with NO_MEMBER, and whether each household was given correctly
+    households = [household.split() for household in households]
+    known = np.array([all(len(member) == 3 for member in household) for household in households], dtype = bool)
+    size = max(map(len, households), default = 0)
+    if size == 0:
+        return np.zeros((len(households), 0, 3), dtype = np.intp), known
+    # Every household as one string of digits, broken into codes the same way as the ID strings
+    padding = ''.join(map(str, NO_MEMBER))
+    strings = np.array([''.join(household + [padding] * (size - len(household))) if ok else padding * size
+                        for household, ok in zip(households, known)], dtype = 'U%d' % (3*size))
+    digits = strings.view(np.uint32).reshape(-1, size, 3) - ord('0')
+    known &= (digits <= 9).all(axis = (1, 2))
+    return np.where(known[:, None, None], digits, 0).astype(np.intp), known
+
+
+# --------------------------- Worker Processes --------------------------------
+
+_scorer = None
+
+
+def _init(scorer):
+    global _scorer
+    _scorer = scorer
+
+
+def _score(chunk):
+    ids, households = chunk
+    scores = _scorer.score(ids, households)
+    scores.insert(0, 'ID', ids)
+    return scores
+
+
+# --------------------------- Reading and Writing the Files --------------------------------
+
+def read_chunks(path, column, chunksize, household = None):
+    # The ID strings of each chunk and their households, or None when there is no household column
+    columns = [column] if household is None else [column, household]
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size = chunksize, columns = columns):
+            values = [batch.column(i).to_numpy(zero_copy_only = False).astype(str) for i in range(len(columns))]
+            yield values[0], values[1] if household is not None else None
+    else:
+        for chunk in pd.read_csv(path, usecols = columns, dtype = str, keep_default_na = False, chunksize = chunksize):
+            yield chunk[column].to_numpy(), chunk[household].to_numpy() if household is not None else None
+
+
+class Writer:
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet = None
+        self.header = True
+
+    def write(self, scores):
+        if self.path.endswith('.parquet'):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(scores, preserve_index = False)
+            if self.parquet is None:
+                self.parquet = pq.ParquetWriter(self.path, table.schema)
+            self.parquet.write_table(table)
+        else:
+            scores.to_csv(self.path, mode = 'w' if self.header else 'a', header = self.header, index = False)
+            self.header = False
+
+    def close(self):
+        if self.parquet is not None:
+            self.parquet.close()
+
+
+def score_file(source, target, column = 'ID', chunksize = 1000000, workers = None, household = None):
+    scorer = Scorer.from_snapshot(data.current())
+    workers = workers or os.cpu_count()
+    writer = Writer(target)
+    rows = 0
+
+    with ProcessPoolExecutor(workers, initializer = _init, initargs = (scorer,)) as pool:
+        # Only a few chunks are in flight at a time so that memory use doesn't grow with the size of the file
+        pending = deque()
+        for chunk in read_chunks(source, column, chunksize, household):
+            pending.append(pool.submit(_score, chunk))
+            if len(pending) >= 2*workers:
+                scores = pending.popleft().result()
+                writer.write(scores)
+                rows += len(scores)
+        while pending:
+            scores = pending.popleft().result()
+            writer.write(scores)
+            rows += len(scores)
+
+    writer.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Score a file of ID strings with the risk model')
+    parser.add_argument('source', help = 'CSV or Parquet file with the ID strings')
+    parser.add_argument('target', help = 'CSV or Parquet file to write the scores to')
+    parser.add_argument('--column', default = 'ID', help = 'name of the column with the ID strings')
+    parser.add_argument('--household', default = None, help = 'name of the column with the households, if there is one')
+    parser.add_argument('--chunksize', type = int, default = 1000000, help = 'number of rows scored at a time')
+    parser.add_argument('--workers', type = int, default = None, help = 'number of worker processes')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rows = score_file(args.source, args.target, args.column, args.chunksize, args.workers, args.household)
+    print('Scored %d rows in %.1f seconds' % (rows, time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
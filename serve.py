@@ -0,0 +1,75 @@
+import argparse
+import gc
+import os
+
+from gunicorn.app.base import BaseApplication
+
+import data
+from index import server
+
+# --------------------------- Serving the App in Production --------------------------------
+
+# python serve.py --workers 8 --bind 0.0.0.0:8050
+#
+# The app is served by a pre-forking gunicorn server, without the debug reloader and without installing anything
+# The data is loaded once by the master process before the workers are forked, so the workers share it
+# copy-on-write instead of each fetching the whole sheet
+# Only the master refreshes the data from the Sheets API. It saves every new version to the snapshot on disk
+# and the workers read it from there (see data.watch), so the number of Sheets API calls
+# doesn't grow with the number of workers
+# The numeric columns of a snapshot read from disk are memory-mapped and shared by the workers. Each worker still
+# holds its own copy of the text columns, such as the form responses, and of the tables derived from the data
+
+
+class Server(BaseApplication):
+
+    def __init__(self, app, options):
+        self.app = app
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.app
+
+
+def when_ready(arbiter):
+    # Runs in the master once it is listening, the workers get their own copy of the data when they are forked
+    data.start_refresher()
+
+
+def post_fork(arbiter, worker):
+    data.watch()
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Serve the app with several worker processes')
+    parser.add_argument('--bind', default = '0.0.0.0:' + os.environ.get('PORT', '8050'), help = 'address to listen on')
+    parser.add_argument('--workers', type = int, default = os.cpu_count(), help = 'number of worker processes')
+    parser.add_argument('--threads', type = int, default = 4, help = 'number of threads in each worker')
+    parser.add_argument('--timeout', type = int, default = 60, help = 'seconds before a silent worker is restarted')
+    args = parser.parse_args()
+
+    # Load the data and compute everything derived from it before forking
+    data.current()
+    # Objects that exist now are never looked at by the garbage collector again,
+    # so it doesn't touch (and copy) the memory the workers share with the master
+    gc.freeze()
+
+    Server(server, {
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',
+        'timeout': args.timeout,
+        'preload_app': True,
+        'when_ready': when_ready,
+        'post_fork': post_fork
+    }).run()
+
+
+if __name__ == '__main__':
+    main()